@@ -0,0 +1,144 @@
+# alldiff.py
+
+"""
+Custom propagator for the all-different constraints of Sudoku, used as an inference argument to backtracking_search in
+place of mac. Instead of revising arcs one value pair at a time, it works on whole units: the values of all singleton
+cells in a unit are removed from the other cells in one pass, and a worklist of units (without duplicates) is
+propagated to a fixpoint. alldiff_matching additionally runs the matching-based filtering of Regin's all-different
+algorithm on every unit it visits.
+
+Both work on the masks of a SudokuCSP; for a generic CSP they fall back to mac.
+"""
+
+from sudoku_csp import SudokuCSP
+from stats import timed_phase
+from backtracking import mac
+
+
+def alldiff(csp, var, value, assignment, removals):
+    """All-different propagation from the units of var after it is assigned value"""
+    if not isinstance(csp, SudokuCSP):
+        return mac(csp, var, value, assignment, removals)
+    return propagate_units(csp, csp.index.unit_ids_of[var], removals)
+
+
+def alldiff_matching(csp, var, value, assignment, removals):
+    """All-different propagation with matching-based filtering from the units of var after it is assigned value"""
+    if not isinstance(csp, SudokuCSP):
+        return mac(csp, var, value, assignment, removals)
+    return propagate_units(csp, csp.index.unit_ids_of[var], removals, matching=True)
+
+
+@timed_phase('alldiff')
+def propagate_units(csp, units, removals, matching=False):
+    """Propagate the all-different constraints of the given units, and of every unit touched on the way, to a
+    fixpoint. Returns False as soon as a unit has no solution."""
+    domains = csp.curr_domains
+    index = csp.index
+    popcount = csp.popcount
+    queue = list(units)
+    queued = [False] * len(index.units)
+    for u in queue:
+        queued[u] = True
+    while queue:
+        u = queue.pop()
+        queued[u] = False
+        cells = index.units[u]
+        singles = 0
+        union = 0
+        for c in cells:
+            d = domains[c]
+            union |= d
+            if popcount[d] == 1:
+                if singles & d:
+                    return False
+                singles |= d
+        if popcount[union] < len(cells):
+            return False
+        removed = [(c, domains[c] & singles) for c in cells if popcount[domains[c]] != 1 and domains[c] & singles]
+        if matching and not removed:
+            removed = filter_unit(cells, domains, csp.mask_values)
+            if removed is None:
+                return False
+        for c, mask in removed:
+            csp.prune_mask(c, mask, removals)
+            if not domains[c]:
+                return False
+            for w in index.unit_ids_of[c]:
+                if not queued[w]:
+                    queued[w] = True
+                    queue.append(w)
+    return True
+
+
+def filter_unit(cells, domains, mask_values):
+    """Regin's filtering for one all-different unit: find a maximum matching of cells to values, then drop every value
+    whose edge lies in no maximum matching, i.e. whose cell and value fall in different strongly connected components of
+    the residual graph. A unit has as many cells as values, so a matching covering every cell leaves no free value.
+    Returns a list of (cell, mask) removals, or None if no matching covers every cell."""
+    n = len(cells)
+    doms = [domains[c] for c in cells]
+    match_cell = [-1] * n
+    match_value = [-1] * n
+
+    def augment(i, seen):
+        for v in mask_values[doms[i]]:
+            v -= 1
+            if not seen[v]:
+                seen[v] = True
+                if match_value[v] == -1 or augment(match_value[v], seen):
+                    match_value[v] = i
+                    match_cell[i] = v
+                    return True
+        return False
+
+    for i in range(n):
+        if not augment(i, [False] * n):
+            return None
+
+    # cells are nodes 0..n-1 and values n..2n-1; unmatched edges go cell -> value, matched value -> cell
+    def successors(x):
+        if x < n:
+            return [n + v - 1 for v in mask_values[doms[x]] if v - 1 != match_cell[x]]
+        return [match_value[x - n]] if match_value[x - n] != -1 else []
+
+    component = [-1] * (2 * n)
+    order = [-1] * (2 * n)
+    low = [0] * (2 * n)
+    stack = []
+    on_stack = [False] * (2 * n)
+    counter = [0, 0]
+
+    def strongconnect(x):
+        order[x] = low[x] = counter[0]
+        counter[0] += 1
+        stack.append(x)
+        on_stack[x] = True
+        for y in successors(x):
+            if order[y] == -1:
+                strongconnect(y)
+                low[x] = min(low[x], low[y])
+            elif on_stack[y]:
+                low[x] = min(low[x], order[y])
+        if low[x] == order[x]:
+            while True:
+                y = stack.pop()
+                on_stack[y] = False
+                component[y] = counter[1]
+                if y == x:
+                    break
+            counter[1] += 1
+
+    for x in range(2 * n):
+        if order[x] == -1:
+            strongconnect(x)
+
+    removed = []
+    for i, c in enumerate(cells):
+        mask = 0
+        for v in mask_values[doms[i]]:
+            if v - 1 != match_cell[i] and component[i] != component[n + v - 1]:
+                mask |= 1 << (v - 1)
+        if mask:
+            removed.append((c, mask))
+    return removed
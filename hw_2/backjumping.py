@@ -0,0 +1,159 @@
+# backjumping.py
+
+"""
+Custom conflict-directed backjumping over a SudokuCSP, with MAC. Every value removed from a domain is explained by the
+decision levels that caused it: a decision explains the values it removes from its own variable, and a prune made by
+revise or find_pairs inherits the explanations of the domains it was derived from. A domain wiped out by AC3 then
+yields the conflict set of the failure, the levels whose decisions together rule the branch out.
+
+When every value of a variable has failed, its conflict set is the union of the conflict sets of its values and the
+explanations of the values pruned from it before, and the search jumps straight back to the deepest decision in it,
+skipping the levels in between, which had nothing to do with the failure and would only fail again. The conflict set
+is also a nogood: those decisions cannot hold together. Nogoods are kept in a bounded NogoodStore and checked on every
+assignment, so a dead end reached again in another branch is cut off at once.
+"""
+
+from collections import OrderedDict
+
+from sudoku_csp import SudokuCSP
+from stats import SolverStats
+from backtracking import order_domain_values, find_pairs, init_domains, mrv, mac
+from limits import SearchStopped, finished, stopped
+
+
+class NogoodStore(object):
+    """Custom LRU store of up to maxsize nogoods, sets of (variable, value) decisions that cannot all hold, of at most
+    max_length decisions each. Each nogood is indexed by its decisions, and the one completed by an assignment is found
+    with violated. Counts the nogoods added, evicted and violated in added, evictions and hits."""
+
+    def __init__(self, maxsize=10000, max_length=12):
+        self.maxsize = maxsize
+        self.max_length = max_length
+        self.nogoods = OrderedDict()
+        self.watches = {}
+        self.added = 0
+        self.evictions = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, nogood):
+        nogood = frozenset(nogood)
+        if not nogood or len(nogood) > self.max_length:
+            return
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+        self.nogoods[nogood] = True
+        for decision in nogood:
+            self.watches.setdefault(decision, set()).add(nogood)
+        self.added += 1
+        if len(self.nogoods) > self.maxsize:
+            old, _ = self.nogoods.popitem(last=False)
+            for decision in old:
+                self.watches[decision].discard(old)
+            self.evictions += 1
+
+    def violated(self, var, value, assignment):
+        """Return a nogood made true by assigning var = value on top of assignment, or None"""
+        for nogood in self.watches.get((var, value), ()):
+            if all(assignment.get(v) == x for v, x in nogood if v != var):
+                self.nogoods.move_to_end(nogood)
+                self.hits += 1
+                return nogood
+        return None
+
+
+def backjumping_search(a, csp, heuristic=mrv, all_methods=True, verbose=True, stats=None, limits=None, nogoods=None,
+                       ordering=order_domain_values):
+    """Custom implementation of backtracking-search with MAC and conflict-directed backjumping, instrumented and called
+    like backtracking_search. A NogoodStore passed as nogoods learns the conflict sets of the search, and can be shared
+    across searches of the same puzzle. Returns a SearchResult when limits are given."""
+    if not isinstance(csp, SudokuCSP):
+        raise TypeError('backjumping_search explains prunes on a SudokuCSP only')
+    levels = {}
+
+    def level_bits(decisions):
+        bits = 0
+        for v, _ in decisions:
+            bits |= 1 << levels[v]
+        return bits
+
+    def backtrack(assignment):
+        """Return (solution, None) or (None, conflict set of the failure as a mask of levels)"""
+        if len(assignment) == len(csp.variables):
+            csp.nguesses = sum(guesses)
+            if verbose:
+                print('{} guesses'.format(csp.nguesses))
+            return assignment, None
+        var = heuristic(assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        depth = len(assignment)
+        bit = 1 << depth
+        levels[var] = depth
+        values = ordering(var, assignment, csp)
+        guesses.append(len(values) - 1)
+        conflict = 0
+        for value in values:
+            if csp.nconflicts(var, value, assignment) != 0:
+                conflict |= level_bits((n, value) for n in csp.peers[var] if assignment.get(n) == value)
+                continue
+            if nogoods is not None:
+                nogood = nogoods.violated(var, value, assignment)
+                if nogood is not None:
+                    conflict |= level_bits(d for d in nogood if d[0] != var)
+                    continue
+            csp.assign(var, value, assignment)
+            csp.reason = bit
+            removals = csp.suppose(var, value)
+            if all_methods:
+                find_pairs(csp, removals)
+            if mac(csp, var, value, assignment, removals):
+                result, failure = backtrack(assignment)
+                if result is not None:
+                    return result, None
+            else:
+                failure = csp.failure
+            csp.restore(removals)
+            if stats is not None:
+                stats.backtracks += 1
+            if not failure & bit:
+                # var played no part in the failure, so none of its other values can help: jump past it
+                csp.unassign(var, assignment)
+                del levels[var]
+                return None, failure
+            conflict |= failure & ~bit
+        conflict = (conflict | csp.why(var)) & ~bit
+        csp.unassign(var, assignment)
+        del levels[var]
+        if nogoods is not None:
+            nogoods.add((v, x) for v, x in assignment.items() if conflict >> levels[v] & 1)
+        return None, conflict
+
+    guesses = []
+    if limits is not None:
+        stats = stats if stats is not None else SolverStats()
+        limits.start()
+    csp.stats = stats
+    nprunes = csp.nprunes
+    try:
+        if all_methods:
+            init_domains(csp, a)
+        csp.start_explaining()
+        result, _ = backtrack({})
+    except SearchStopped as e:
+        e.assignment = {**a, **e.assignment}
+        csp.nguesses = sum(guesses)
+        return stopped(e, stats)
+    finally:
+        if stats is not None:
+            stats.prunes += csp.nprunes - nprunes
+        csp.stats = None
+        csp.explain = None
+    if limits is not None:
+        return finished(result, csp, stats)
+    return result
@@ -5,8 +5,11 @@ All methods in csp.py are based on implementations from Russell And Norvig's "Ar
 Approach" at https://github.com/aimacode/aima-python unless otherwise noted.
 """
 
-from utils import (first, argmin_random_tie, num_legal_val, revise, same_row, same_col, same_box,
-                   get_row, get_col, get_box)
+from utils import first, argmin_random_tie, num_legal_val, revise
+from sudoku_index import get_index, box_for
+from sudoku_csp import SudokuCSP
+from stats import SolverStats, timed_phase
+from limits import SearchStopped, finished, stopped
 
 
 def equal_constraint(A, a, B, b):
@@ -17,15 +20,41 @@ def order_domain_values(var, assignment, csp):
     return csp.choices(var)
 
 
+def lcv(var, assignment, csp):
+    """Custom least-constraining-value ordering: the values of var ruling out fewest values of other variables first,
+    counted from per-unit supports on a SudokuCSP with domains, or else as conflicts with the assignment"""
+    if isinstance(csp, SudokuCSP) and csp.curr_domains is not None:
+        return csp.lcv(var)
+    return sorted(csp.choices(var), key=lambda val: csp.nconflicts(var, val, assignment))
+
+
 def first_unassigned_variable(assignment, csp):
     return first([var for var in csp.variables if var not in assignment])
 
 
 def mrv(assignment, csp):
+    if isinstance(csp, SudokuCSP):
+        return csp.mrv(assignment)
     return argmin_random_tie([v for v in csp.variables if v not in assignment],
                              key=lambda var: num_legal_val(csp, var, assignment))
 
 
+def dom_wdeg(assignment, csp):
+    """Custom dom/wdeg heuristic: the variable with the least domain size over weighted degree, where the weight of a
+    constraint is 1 plus the number of times AC3 wiped out a domain on it. The weights live in csp.weights, so they
+    carry over the whole search."""
+    if isinstance(csp, SudokuCSP):
+        return csp.dom_wdeg(assignment)
+    if csp.weights is None:
+        csp.weights = {}
+
+    def wdeg(var):
+        return sum(csp.weights.get(frozenset((var, n)), 1) for n in csp.neighbors[var] if n not in assignment) or 1
+
+    return argmin_random_tie([v for v in csp.variables if v not in assignment],
+                             key=lambda var: num_legal_val(csp, var, assignment) / wdeg(var))
+
+
 def no_inference(csp, var, value, assignment, removals):
     return True
 
@@ -35,14 +64,22 @@ def mac(csp, var, value, assignment, removals):
     return ac3
 
 
+@timed_phase('AC3')
 def AC3(csp, queue=None, removals=None):
     if queue is None:
         queue = [(Xi, Xk) for Xi in csp.variables for Xk in csp.neighbors[Xi]]
     csp.support_pruning()
+    if csp.stats is not None:
+        queue = csp.stats.traced(queue)
+    if isinstance(csp, SudokuCSP):
+        return csp.AC3(queue, removals)
     while queue:
         (Xi, Xj) = queue.pop()
         if revise(csp, Xi, Xj, removals):
             if not csp.curr_domains[Xi]:
+                if csp.weights is not None:
+                    arc = frozenset((Xi, Xj))
+                    csp.weights[arc] = csp.weights.get(arc, 1) + 1
                 return False
             for Xk in csp.neighbors[Xi]:
                 if Xk != Xj:
@@ -50,20 +87,24 @@ def AC3(csp, queue=None, removals=None):
     return True
 
 
+@timed_phase('find_pairs')
 def find_pairs(csp, removals):
     """Custom implementation of hidden pairs inference method"""
+    if isinstance(csp, SudokuCSP):
+        return csp.find_pairs(removals)
+    index = get_index(box_for(len(csp.variables)))
     for v1 in csp.variables:
         d1 = set(csp.curr_domains[v1])
         for v2 in csp.neighbors[v1]:
             d2 = set(csp.curr_domains[v2])
             if len(d1) == 2 and d1 == d2:
-                others = []
-                if same_row(v1, v2):
-                    others = get_row(v1)
-                elif same_col(v1, v2):
-                    others = get_col(v1)
-                if same_box(v1, v2):
-                    others += get_box(v1)
+                others = ()
+                if index.row_of[v1] == index.row_of[v2]:
+                    others = index.rows[index.row_of[v1]]
+                elif index.col_of[v1] == index.col_of[v2]:
+                    others = index.cols[index.col_of[v1]]
+                if index.box_of[v1] == index.box_of[v2]:
+                    others += index.boxes[index.box_of[v1]]
                 for v3 in set(others):
                     if v3 != v1 and v3 != v2:
                         for d in csp.curr_domains[v3]:
@@ -71,14 +112,18 @@ def find_pairs(csp, removals):
                                 csp.prune(v3, d, removals)
 
 
+@timed_phase('init_domains')
 def init_domains(csp, assignment):
     """Custom implementation of domain initialization preprocessing step"""
+    if isinstance(csp, SudokuCSP):
+        return csp.init_domains(assignment)
+    size = box_for(len(csp.variables)) ** 2
     d = {}
     for i in csp.variables:
         no = [assignment.get(n) for n in csp.neighbors[i]]
         l = []
         if len(csp.domains[i]) > 0:
-            for j in range(1, 10):
+            for j in range(1, size + 1):
                 if j not in no:
                     l.append(j)
         d[i] = l
@@ -88,48 +133,102 @@ def init_domains(csp, assignment):
     print('Average domain size: {}', ave)"""
 
 
-def recursive_backtracking_search(assignment, csp, heuristic):
-    """Custom implementation of simple recursive backtracking-search"""
-    if len(assignment) == len(csp.variables):
-        return assignment
-    var = heuristic(assignment, csp)
-    for value in order_domain_values(var, assignment, csp):
-        if csp.nconflicts(var, value, assignment) == 0:
-            csp.assign(var, value, assignment)
-            result = recursive_backtracking_search(assignment, csp, heuristic)
-            if result is not None:
-                return result
-            csp.unassign(var, assignment)
-    return None
-
-
-def instrumented_recursive_backtracking(assignment, csp, heuristic, guesses=[]):
-    """Custom implementation of simple recursive backtracking-search instrumented to show number of guesses made"""
-    if len(assignment) == len(csp.variables):
-        print('{} guesses'.format(sum(guesses)))
-        return assignment
-    var = heuristic(assignment, csp)
-    values = order_domain_values(var, assignment, csp)
-    guesses.append(len(values) - 1)
-    for value in values:
-        if csp.nconflicts(var, value, assignment) == 0:
-            csp.assign(var, value, assignment)
-            result = instrumented_recursive_backtracking(assignment, csp, heuristic, guesses)
-            if result is not None:
-                return result
-            csp.unassign(var, assignment)
-    return None
-
-
-def backtracking_search(a, csp, heuristic, inference, all_methods):
-    """Custom implementation of backtracking-search instrumented to show number of guesses made"""
+def recursive_backtracking_search(assignment, csp, heuristic, stats=None, limits=None,
+                                  ordering=order_domain_values):
+    """Custom implementation of simple recursive backtracking-search, trying values in the order given by ordering.
+    Returns a SearchResult when limits are given."""
 
     def backtrack(assignment):
         if len(assignment) == len(csp.variables):
-            print('{} guesses'.format(sum(guesses)))
             return assignment
         var = heuristic(assignment, csp)
-        values = order_domain_values(var, assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        for value in ordering(var, assignment, csp):
+            if csp.nconflicts(var, value, assignment) == 0:
+                csp.assign(var, value, assignment)
+                result = backtrack(assignment)
+                if result is not None:
+                    return result
+                csp.unassign(var, assignment)
+                if stats is not None:
+                    stats.backtracks += 1
+        return None
+
+    if limits is None:
+        return backtrack(assignment)
+    stats = stats if stats is not None else SolverStats()
+    limits.start()
+    try:
+        return finished(backtrack(assignment), csp, stats)
+    except SearchStopped as e:
+        return stopped(e, stats)
+
+
+def instrumented_recursive_backtracking(assignment, csp, heuristic, guesses=None, verbose=True, stats=None,
+                                        limits=None, ordering=order_domain_values):
+    """Custom implementation of simple recursive backtracking-search instrumented to show number of guesses made, which
+    is also kept in csp.nguesses, trying values in the order given by ordering. Returns a SearchResult when limits are
+    given."""
+    if guesses is None:
+        guesses = []
+
+    def backtrack(assignment):
+        if len(assignment) == len(csp.variables):
+            csp.nguesses = sum(guesses)
+            if verbose:
+                print('{} guesses'.format(csp.nguesses))
+            return assignment
+        var = heuristic(assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        values = ordering(var, assignment, csp)
+        guesses.append(len(values) - 1)
+        for value in values:
+            if csp.nconflicts(var, value, assignment) == 0:
+                csp.assign(var, value, assignment)
+                result = backtrack(assignment)
+                if result is not None:
+                    return result
+                csp.unassign(var, assignment)
+                if stats is not None:
+                    stats.backtracks += 1
+        return None
+
+    if limits is None:
+        return backtrack(assignment)
+    stats = stats if stats is not None else SolverStats()
+    limits.start()
+    try:
+        return finished(backtrack(assignment), csp, stats)
+    except SearchStopped as e:
+        csp.nguesses = sum(guesses)
+        return stopped(e, stats)
+
+
+def backtracking_search(a, csp, heuristic, inference, all_methods, verbose=True, stats=None, limits=None,
+                        ordering=order_domain_values):
+    """Custom implementation of backtracking-search instrumented to show number of guesses made, which is also kept in
+    csp.nguesses. heuristic picks the next variable (first_unassigned_variable, mrv or dom_wdeg) and ordering orders
+    its values (order_domain_values or lcv). A SolverStats passed as stats is attached to csp for the duration of the
+    search. Returns a SearchResult when limits are given, with the givens in a included in a partial assignment."""
+
+    def backtrack(assignment):
+        if len(assignment) == len(csp.variables):
+            csp.nguesses = sum(guesses)
+            if verbose:
+                print('{} guesses'.format(csp.nguesses))
+            return assignment
+        var = heuristic(assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        values = ordering(var, assignment, csp)
         guesses.append(len(values) - 1)
         for value in values:
             if csp.nconflicts(var, value, assignment) == 0:
@@ -142,10 +241,84 @@ def backtracking_search(a, csp, heuristic, inference, all_methods):
                     if result is not None:
                         return result
                 csp.restore(removals)
+                if stats is not None:
+                    stats.backtracks += 1
         csp.unassign(var, assignment)
         return None
 
     guesses = []
-    if all_methods:
-        init_domains(csp, a)
-    return backtrack({})
+    if limits is not None:
+        stats = stats if stats is not None else SolverStats()
+        limits.start()
+    csp.stats = stats
+    nprunes = csp.nprunes
+    try:
+        if all_methods:
+            init_domains(csp, a)
+        result = backtrack({})
+    except SearchStopped as e:
+        e.assignment = {**a, **e.assignment}
+        csp.nguesses = sum(guesses)
+        return stopped(e, stats)
+    finally:
+        if stats is not None:
+            stats.prunes += csp.nprunes - nprunes
+        csp.stats = None
+    if limits is not None:
+        return finished(result, csp, stats)
+    return result
+
+
+def iter_solutions(csp, heuristic=mrv, inference=mac, stats=None, limits=None, ordering=order_domain_values):
+    """Custom generator over every solution of csp, found lazily by backtracking-search with the given heuristic and
+    inference and yielded one at a time as new assignment dicts. The givens are taken from csp.domains. Closing the
+    generator early restores csp to its state before the search. When limits stop the search the generator raises
+    SearchStopped, after restoring csp."""
+
+    def backtrack(assignment):
+        if len(assignment) == len(csp.variables):
+            yield dict(assignment)
+            return
+        var = heuristic(assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        for value in ordering(var, assignment, csp):
+            if csp.nconflicts(var, value, assignment) == 0:
+                csp.assign(var, value, assignment)
+                removals = csp.suppose(var, value)
+                try:
+                    if inference(csp, var, value, assignment, removals):
+                        yield from backtrack(assignment)
+                finally:
+                    csp.restore(removals)
+                    csp.unassign(var, assignment)
+                if stats is not None:
+                    stats.backtracks += 1
+
+    csp.stats = stats
+    if limits is not None:
+        limits.start()
+    try:
+        yield from backtrack({})
+    finally:
+        csp.stats = None
+
+
+def count_solutions(csp, heuristic=mrv, inference=mac, limit=None, stats=None, limits=None):
+    """Custom method to count the solutions of csp, stopping as soon as limit solutions are found. Raises SearchStopped
+    if limits stop the search first."""
+    n = 0
+    solutions = iter_solutions(csp, heuristic, inference, stats, limits)
+    for _ in solutions:
+        n += 1
+        if n == limit:
+            solutions.close()
+            break
+    return n
+
+
+def has_unique_solution(csp, heuristic=mrv, inference=mac, stats=None, limits=None):
+    """Custom uniqueness check: search stops at the second solution. Raises SearchStopped if limits stop it first."""
+    return count_solutions(csp, heuristic, inference, 2, stats, limits) == 1
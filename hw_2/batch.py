@@ -0,0 +1,139 @@
+# batch.py
+
+"""
+Custom batch solving entry point. A corpus of puzzles is spread across a pool of worker processes in chunks, and the
+results stream back with per-puzzle stats, either in corpus order or as they complete.
+
+Usage: python batch.py CORPUS [-p PROCESSES] [-c CHUNKSIZE] [--unordered] [--no-pairs] [-e ENGINE] [--box BOX]
+                       [-o OUTPUT [--grid]]
+"""
+
+import argparse
+import json
+import os
+import time
+from glob import glob
+from multiprocessing import Pool
+
+from sudoku_io import SudokuIO, PuzzleWriter, parse_grids, iter_puzzles, format_line
+from sudoku_csp import SudokuCSP
+from backtracking import backtracking_search, mrv, mac
+from dlx import dlx_search
+from board import Board
+from iterative import iterative_search
+from backjumping import backjumping_search
+from limits import SearchLimits
+from sudoku import ENGINES, check_engine
+
+
+def read_corpus(corpus, box=3):
+    """Yield (name, values) pairs from a puzzle file (optionally gzip-compressed), a directory of puzzle_<id>.txt files
+    or an iterable of puzzles given as grid text or sequences of 81 values, of grids made of box x box boxes"""
+    if isinstance(corpus, str) and os.path.isdir(corpus):
+        for path in sorted(glob(os.path.join(corpus, 'puzzle_*.txt'))):
+            for values in iter_puzzles(path, box):
+                yield os.path.basename(path)[len('puzzle_'):-len('.txt')], values
+    elif isinstance(corpus, str):
+        for i, values in enumerate(iter_puzzles(corpus, box)):
+            yield i, values
+    else:
+        for i, puzzle in enumerate(corpus):
+            if isinstance(puzzle, str):
+                for values in parse_grids(puzzle, box):
+                    yield i, values
+            else:
+                yield i, list(puzzle)
+
+
+def solve_values(values, all_methods=True, engine='backtracking', timeout=None):
+    """Solve one puzzle given as 81 values (or the cells of a larger grid) or as a Board with the backtracking,
+    iterative, backjumping or dlx engine, giving up after timeout seconds if set, and return its status and solution
+    with stats. Raises ValueError for an engine not in ENGINES."""
+    check_engine(engine)
+    start = time.perf_counter()
+    limits = SearchLimits(timeout=timeout) if timeout is not None else None
+    if isinstance(values, Board):
+        givens = values
+        sudoku = SudokuCSP.from_board(values)
+    else:
+        puzzle = SudokuIO(values=values)
+        givens = puzzle.assignment
+        sudoku = SudokuCSP(puzzle.variables, puzzle.domains, puzzle.neighbors)
+    if engine == 'dlx':
+        result = dlx_search(givens, sudoku, verbose=False, limits=limits)
+    elif engine == 'iterative':
+        result = iterative_search(givens, sudoku, mrv, mac, all_methods, verbose=False, limits=limits)
+    elif engine == 'backjumping':
+        result = backjumping_search(givens, sudoku, mrv, all_methods, verbose=False, limits=limits)
+    else:
+        result = backtracking_search(givens, sudoku, mrv, mac, all_methods, verbose=False, limits=limits)
+    status = 'solved' if result is not None else 'unsatisfiable'
+    if limits is not None:
+        status = result.status
+        result = result.assignment if status == 'solved' else None
+    return {
+        'status': status,
+        'solution': [result[i] for i in sudoku.variables] if result is not None else None,
+        'time': time.perf_counter() - start,
+        'nassigns': sudoku.nassigns,
+        'guesses': sudoku.nguesses,
+    }
+
+
+def _solve_task(task):
+    index, name, values, all_methods, engine = task
+    stats = solve_values(values, all_methods, engine)
+    stats['index'] = index
+    stats['name'] = name
+    return stats
+
+
+def solve_batch(corpus, processes=None, chunksize=64, ordered=True, all_methods=True, engine='backtracking', box=3):
+    """Solve every puzzle in corpus across processes workers (all cores by default) and yield a stats dict per puzzle.
+    Results come back in corpus order if ordered, otherwise as they complete."""
+    tasks = ((i, name, values, all_methods, engine) for i, (name, values) in enumerate(read_corpus(corpus, box)))
+    if processes == 1:
+        for task in tasks:
+            yield _solve_task(task)
+        return
+    with Pool(processes) as pool:
+        results = pool.imap(_solve_task, tasks, chunksize) if ordered else \
+            pool.imap_unordered(_solve_task, tasks, chunksize)
+        for stats in results:
+            yield stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve a corpus of Sudoku puzzles across worker processes.')
+    parser.add_argument('corpus', help='puzzle file or directory of puzzle_<id>.txt files')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('-c', '--chunksize', type=int, default=64, help='puzzles sent to a worker at a time')
+    parser.add_argument('--unordered', action='store_true', help='report puzzles as they complete')
+    parser.add_argument('--no-pairs', action='store_true', help='run MAC only, without find_pairs/init_domains')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default='backtracking', help='solver engine')
+    parser.add_argument('--box', type=int, default=3, help='box size of the grids, e.g. 4 for 16x16 (default: 3)')
+    parser.add_argument('-o', '--output', help='append solutions to this file (.gz to compress)')
+    parser.add_argument('--grid', action='store_true', help='write solutions in the spaced grid format')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    solved = total = 0
+    writer = PuzzleWriter(args.output, args.grid) if args.output else None
+    for stats in solve_batch(args.corpus, args.processes, args.chunksize, not args.unordered, not args.no_pairs,
+                             args.engine, args.box):
+        total += 1
+        if stats['solution'] is not None:
+            solved += 1
+            if writer is not None:
+                writer.write(stats['solution'])
+            stats['solution'] = format_line(stats['solution']).rstrip()
+        print(json.dumps(stats))
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print('Solved {} of {} puzzles in {:.3f}s ({:.1f} puzzles/s)'.format(solved, total, elapsed,
+                                                                         total / elapsed if elapsed else 0.0))
+
+
+if __name__ == '__main__':
+    main()
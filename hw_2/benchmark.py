@@ -0,0 +1,156 @@
+# benchmark.py
+
+"""
+Custom benchmark harness. Runs a fixed corpus through every solver configuration with a seeded RNG (so the random
+tie-breaking in argmin_random_tie is reproducible) and records wall time, nassigns, guesses, prunes and peak memory per
+puzzle. Results are saved as JSON, and a run fails when a configuration regresses beyond a threshold against a stored
+baseline.
+
+Usage: python benchmark.py [-c CORPUS] [--configs NAME ...] [-o RESULTS] [-b BASELINE] [-t THRESHOLD]
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from batch import read_corpus
+from sudoku_io import SudokuIO
+from utils import CSP
+from sudoku_csp import SudokuCSP
+from backtracking import (instrumented_recursive_backtracking, backtracking_search, first_unassigned_variable, mrv,
+                          mac, equal_constraint)
+from dlx import dlx_search
+from alldiff import alldiff, alldiff_matching
+from rules import RuleEngine
+from iterative import iterative_search
+from backjumping import backjumping_search
+
+CONFIGS = {
+    'recursive-first': (CSP, lambda p, s: instrumented_recursive_backtracking(dict(p.assignment), s,
+                                                                              first_unassigned_variable, [], False)),
+    'recursive-mrv': (CSP, lambda p, s: instrumented_recursive_backtracking(dict(p.assignment), s, mrv, [], False)),
+    'mac': (CSP, lambda p, s: backtracking_search(p.assignment, s, mrv, mac, False, verbose=False)),
+    'mac-pairs': (CSP, lambda p, s: backtracking_search(p.assignment, s, mrv, mac, True, verbose=False)),
+    'bitmask-recursive-mrv': (SudokuCSP, lambda p, s: instrumented_recursive_backtracking(dict(p.assignment), s,
+                                                                                          mrv, [], False)),
+    'bitmask-mac': (SudokuCSP, lambda p, s: backtracking_search(p.assignment, s, mrv, mac, False, verbose=False)),
+    'bitmask-mac-pairs': (SudokuCSP, lambda p, s: backtracking_search(p.assignment, s, mrv, mac, True, verbose=False)),
+    'bitmask-alldiff': (SudokuCSP, lambda p, s: backtracking_search(p.assignment, s, mrv, alldiff, False,
+                                                                    verbose=False)),
+    'bitmask-alldiff-matching': (SudokuCSP, lambda p, s: backtracking_search(p.assignment, s, mrv, alldiff_matching,
+                                                                             False, verbose=False)),
+    'bitmask-rules': (SudokuCSP, lambda p, s: backtracking_search(p.assignment, s, mrv, RuleEngine(), False,
+                                                                  verbose=False)),
+    'bitmask-iterative': (SudokuCSP, lambda p, s: iterative_search(p.assignment, s, mrv, mac, True, verbose=False)),
+    'bitmask-backjumping': (SudokuCSP, lambda p, s: backjumping_search(p.assignment, s, mrv, True, verbose=False)),
+    'dlx': (SudokuCSP, lambda p, s: dlx_search(p.assignment, s, verbose=False)),
+}
+
+METRICS = ('time', 'nassigns', 'guesses', 'prunes', 'peak_memory')
+
+
+def run_puzzle(config, values, seed, repeat=1):
+    """Solve one puzzle with a configuration and return its metrics. Time is the best of repeat runs, and peak memory
+    comes from a separate traced run so tracing does not skew the timing."""
+    backend, search = CONFIGS[config]
+
+    def run():
+        random.seed(seed)
+        puzzle = SudokuIO(values=values)
+        sudoku = backend(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint)
+        start = time.perf_counter()
+        result = search(puzzle, sudoku)
+        return time.perf_counter() - start, sudoku, result
+
+    elapsed = min(run()[0] for _ in range(repeat))
+    tracemalloc.start()
+    _, sudoku, result = run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'time': elapsed,
+        'nassigns': sudoku.nassigns,
+        'guesses': sudoku.nguesses,
+        'prunes': sudoku.nprunes,
+        'peak_memory': peak,
+        'solved': result is not None,
+    }
+
+
+def run_benchmark(corpus='puzzles', configs=None, seed=0, repeat=1):
+    """Run every configuration over the corpus and return the results as a JSON-serialisable dict"""
+    puzzles = list(read_corpus(corpus))
+    results = {
+        'corpus': corpus,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'configs': {},
+    }
+    for config in configs or CONFIGS:
+        rows = []
+        for name, values in puzzles:
+            row = run_puzzle(config, values, seed, repeat)
+            row['puzzle'] = name
+            rows.append(row)
+        totals = {m: sum(row[m] for row in rows) for m in METRICS}
+        totals['peak_memory'] = max(row['peak_memory'] for row in rows) if rows else 0
+        totals['solved'] = sum(row['solved'] for row in rows)
+        results['configs'][config] = {'totals': totals, 'puzzles': rows}
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    """Return a message for every configuration total that grew by more than threshold (a fraction) over the
+    baseline, or that solved fewer puzzles"""
+    regressions = []
+    for config, entry in results['configs'].items():
+        if config not in baseline['configs']:
+            continue
+        new = entry['totals']
+        old = baseline['configs'][config]['totals']
+        if new['solved'] < old['solved']:
+            regressions.append('{}: solved {} < {}'.format(config, new['solved'], old['solved']))
+        for m in METRICS:
+            if old[m] and new[m] > old[m] * (1 + threshold):
+                regressions.append('{}: {} {:.6g} > {:.6g} (+{:.1%})'.format(config, m, new[m], old[m],
+                                                                             new[m] / old[m] - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Sudoku solver configurations.')
+    parser.add_argument('-c', '--corpus', default='puzzles', help='puzzle file or directory (default: puzzles)')
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), help='configurations to run (default: all)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed for the random tie-breaking')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='runs per puzzle, the fastest is kept')
+    parser.add_argument('-o', '--output', help='save the results as JSON')
+    parser.add_argument('-b', '--baseline', help='JSON results to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='allowed growth of any total over the baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.corpus, args.configs, args.seed, args.repeat)
+    for config, entry in results['configs'].items():
+        totals = entry['totals']
+        print('{:<24} time {:9.4f}s  nassigns {:8d}  guesses {:7d}  prunes {:9d}  peak {:9d}B  solved {}'.format(
+            config, totals['time'], totals['nassigns'], totals['guesses'], totals['prunes'], totals['peak_memory'],
+            totals['solved']))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.threshold)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# board.py
+
+"""
+Custom compact puzzle representation. A Board is the size ** 2 characters of a puzzle in the line format at an offset
+of a bytes-like buffer (bytes, bytearray, an array of bytes or a memory map), referenced rather than copied, so a
+board over a memory-mapped corpus costs one small object per puzzle. It reads as a mapping of the given cells to their
+values, the form of the givens passed to the search functions, so it can be solved without building the dicts of
+SudokuIO.
+
+A BoardCorpus memory-maps a file of puzzles in the line format and keeps only the offset of each line, making boards
+over the map on demand.
+"""
+
+import mmap
+from array import array
+from collections.abc import Mapping
+
+from sudoku_index import get_index, box_for
+from sudoku_io import DIGITS, format_line
+
+# value of each byte of the line format, with -1 for bytes that are not a cell
+CELL_VALUES = [-1] * 256
+for _i, _c in enumerate(DIGITS):
+    CELL_VALUES[ord(_c)] = _i
+    CELL_VALUES[ord(_c.lower())] = _i
+CELL_VALUES[ord('.')] = CELL_VALUES[ord('-')] = 0
+
+
+class Board(Mapping):
+    """Custom read-only puzzle of box x box boxes whose cells are the bytes at offset in buffer. As a mapping it holds
+    the given cells only; cells returns every cell value, with 0 for empty cells."""
+    __slots__ = ('buffer', 'offset', 'box')
+
+    def __init__(self, buffer, offset=0, box=3):
+        self.buffer = buffer
+        self.offset = offset
+        self.box = box
+
+    @classmethod
+    def from_values(cls, values):
+        """Return a board over a new buffer holding the cell values"""
+        return cls(format_line(values)[:-1].encode(), 0, box_for(len(values)))
+
+    @property
+    def index(self):
+        return get_index(self.box)
+
+    def cells(self):
+        """Return the list of cell values"""
+        start = self.offset
+        return [CELL_VALUES[c] for c in self.buffer[start:start + self.box ** 4]]
+
+    def __getitem__(self, cell):
+        if 0 <= cell < self.box ** 4:
+            value = CELL_VALUES[self.buffer[self.offset + cell]]
+            if value > 0:
+                return value
+        raise KeyError(cell)
+
+    def __contains__(self, cell):
+        return 0 <= cell < self.box ** 4 and CELL_VALUES[self.buffer[self.offset + cell]] > 0
+
+    def __iter__(self):
+        return (cell for cell, value in enumerate(self.cells()) if value)
+
+    def __len__(self):
+        return sum(1 for value in self.cells() if value)
+
+    def __eq__(self, other):
+        if isinstance(other, Board):
+            return self.box == other.box and self.cells() == other.cells()
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # a board over a memory map is pickled with a copy of its own cells only
+        start = self.offset
+        return Board, (bytes(self.buffer[start:start + self.box ** 4]), 0, self.box)
+
+    def __repr__(self):
+        return 'Board({!r})'.format(format_line(self.cells())[:-1])
+
+
+class BoardCorpus(object):
+    """Custom corpus of the puzzles in a plain (not compressed) file with one puzzle per line in the line format, of
+    box x box boxes, memory-mapped and indexed by the offsets of the puzzle lines. Lines too short to hold a puzzle are
+    skipped, so blank lines and trailing text are allowed. Boards taken from the corpus are valid until it is closed."""
+
+    def __init__(self, path, box=3):
+        self.box = box
+        self.file = open(path, 'rb')
+        self.offsets = array('Q')
+        if self.file.seek(0, 2) == 0:
+            self.map = b''
+            return
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        n = box ** 4
+        size = len(self.map)
+        start = 0
+        while start < size:
+            end = self.map.find(b'\n', start)
+            if end == -1:
+                end = size
+            if end - start >= n and CELL_VALUES[self.map[start + n - 1]] >= 0:
+                self.offsets.append(start)
+            start = end + 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return Board(self.map, self.offsets[i], self.box)
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield Board(self.map, offset, self.box)
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
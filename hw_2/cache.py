@@ -0,0 +1,300 @@
+# cache.py
+
+"""
+Custom solution cache in front of sudoku.solve. Puzzles are looked up first by their exact givens, and then by a
+canonical form that is the same for every puzzle reachable through the Sudoku symmetries: digit relabelling, row and
+column permutations within bands and stacks, band and stack swaps, and transposition. A solution found under the
+canonical form is mapped back through the inverse transform, so a duplicate costs a hash lookup rather than a search.
+
+Finding the canonical form costs more than solving most puzzles (about 20 ms against 5 ms for a SudokuCSP solve), so
+SolutionCache.solve first gives a puzzle missing from the exact tier a probe search of probe_nodes nodes. Only the
+puzzles that outlast the probe are canonicalised and looked up by their canonical form.
+
+Both tiers are bounded LRU maps, and canonical solutions can also be kept in an on-disk shelve that outlives the
+process. Only 9x9 grids are canonicalised; larger grids use the exact tier alone.
+"""
+
+import shelve
+from collections import OrderedDict
+from itertools import permutations, product
+
+from sudoku_index import INDEX
+from sudoku import solve
+from limits import SearchLimits, SearchResult
+
+SIZE = INDEX.size
+BOX = INDEX.box
+
+
+def _line_orders():
+    """All orders of the lines of a grid that keep the bands (or stacks) together"""
+    orders = []
+    for bands in permutations(range(BOX)):
+        for inner in product(permutations(range(BOX)), repeat=BOX):
+            orders.append(tuple(b * BOX + inner[k][i] for k, b in enumerate(bands) for i in range(BOX)))
+    return orders
+
+
+COL_ORDERS = _line_orders()
+# row masks under every column order, kept for the PERMUTED_SIZE masks used last
+_PERMUTED = OrderedDict()
+PERMUTED_SIZE = 128
+
+# canonical_form gives up on puzzles whose symmetries leave more partial transforms tied than this, e.g. near-empty
+# grids, which bounds its cost on them
+CANDIDATE_LIMIT = 20000
+
+# nodes of the probe search of SolutionCache.solve, about the cost of a canonical form at some 0.2 ms a node
+PROBE_NODES = 100
+
+
+def _permuted(mask):
+    """Return the row mask (column 0 in the highest bit) under every column order, so comparing two of them as integers
+    compares the blank patterns lexicographically"""
+    if mask in _PERMUTED:
+        _PERMUTED.move_to_end(mask)
+        return _PERMUTED[mask]
+    table = [sum(1 << (SIZE - 1 - j) for j, c in enumerate(order) if mask >> (SIZE - 1 - c) & 1)
+             for order in COL_ORDERS]
+    _PERMUTED[mask] = table
+    if len(_PERMUTED) > PERMUTED_SIZE:
+        _PERMUTED.popitem(last=False)
+    return table
+
+
+def _next_rows(rows):
+    """The rows that may come next after rows: any row of an unused band at a band boundary, else one of the band"""
+    if len(rows) % BOX == 0:
+        used = {r // BOX for r in rows}
+        return [r for r in range(SIZE) if r // BOX not in used]
+    band = rows[-1] // BOX
+    return [r for r in range(band * BOX, band * BOX + BOX) if r not in rows]
+
+
+def canonical_form(values):
+    """Return the canonical form of 81 cell values as a string, together with a transform (transposed, rows, cols,
+    labels) such that cell (i, j) of the canonical form is labels[v] for the value v at row rows[i] and column cols[j]
+    of the grid, transposed first if transposed. The form is the least of all transformed grids, compared row by row on
+    the blank pattern first and on the digits, relabelled in order of first appearance, second. Returns None for other
+    grid sizes, or when too many transforms stay tied."""
+    if len(values) != INDEX.num_cells:
+        return None
+    grid = [values[r * SIZE:(r + 1) * SIZE] for r in range(SIZE)]
+    grids = (grid, [list(col) for col in zip(*grid)])
+    masks = [[sum(1 << (SIZE - 1 - j) for j in range(SIZE) if row[j]) for row in g] for g in grids]
+    # partial transforms are grouped by grid variant and rows placed so far, each with its column orders and the digit
+    # labels under each of them
+    groups = {(t, ()): [(p, (0,) * (SIZE + 1)) for p in range(len(COL_ORDERS))] for t in range(2)}
+    form = []
+    for _ in range(SIZE):
+        best = None
+        tied = []
+        for (t, rows), entries in groups.items():
+            for r in _next_rows(rows):
+                table = _permuted(masks[t][r])
+                m = min(table[p] for p, _ in entries)
+                if best is None or m < best:
+                    best = m
+                    tied = []
+                if m == best:
+                    tied.append((t, rows, r, [(p, labels) for p, labels in entries if table[p] == m]))
+        best = None
+        groups = {}
+        size = 0
+        for t, rows, r, entries in tied:
+            row = grids[t][r]
+            for p, labels in entries:
+                labels = list(labels)
+                count = max(labels)
+                line = []
+                for c in COL_ORDERS[p]:
+                    v = row[c]
+                    if v and not labels[v]:
+                        count += 1
+                        labels[v] = count
+                    line.append(labels[v])
+                if best is None or line < best:
+                    best = line
+                    groups = {}
+                    size = 0
+                if line == best:
+                    groups.setdefault((t, rows + (r,)), []).append((p, tuple(labels)))
+                    size += 1
+        if size > CANDIDATE_LIMIT:
+            return None
+        form += best
+    (t, rows), entries = next(iter(groups.items()))
+    p, labels = entries[0]
+    # digits that are not given take the remaining labels in increasing order
+    labels = list(labels)
+    count = max(labels)
+    for v in range(1, SIZE + 1):
+        if not labels[v]:
+            count += 1
+            labels[v] = count
+    return ''.join(str(v) for v in form), (t == 1, rows, COL_ORDERS[p], tuple(labels))
+
+
+def _cells(transform):
+    """Return the grid cell under each cell of the canonical form"""
+    transposed, rows, cols, _ = transform
+    if transposed:
+        return [c * SIZE + r for r in rows for c in cols]
+    return [r * SIZE + c for r in rows for c in cols]
+
+
+def to_canonical(solution, transform):
+    """Map the cell values of a solution of a puzzle to the solution of its canonical form"""
+    labels = transform[3]
+    return ''.join(str(labels[solution[cell]]) for cell in _cells(transform))
+
+
+def from_canonical(solution, transform):
+    """Map the solution of a canonical form back to the cell values of the puzzle with the given transform"""
+    labels = transform[3]
+    values = [0] * len(labels)
+    for v, label in enumerate(labels):
+        values[label] = v
+    result = [0] * INDEX.num_cells
+    for cell, label in zip(_cells(transform), solution):
+        result[cell] = values[int(label)]
+    return result
+
+
+class SolutionCache(object):
+    """Custom LRU cache of solutions keyed by exact givens and by canonical form, each holding up to maxsize puzzles,
+    with an optional shelve at path as a persistent tier for canonical solutions. Puzzles without a solution are cached
+    too. Hits and misses of each tier are counted in hits, canonical_hits, disk_hits and misses, and the puzzles solve
+    found by its probe search of probe_nodes nodes, which are not canonicalised, in probed."""
+
+    def __init__(self, maxsize=4096, path=None, probe_nodes=PROBE_NODES):
+        self.maxsize = maxsize
+        self.probe_nodes = probe_nodes
+        self.exact = OrderedDict()
+        self.canonical = OrderedDict()
+        self.disk = shelve.open(path) if path is not None else None
+        self.hits = 0
+        self.canonical_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.probed = 0
+        self.evictions = 0
+        # the canonical form of the last puzzle looked up, reused when its solution is stored after a miss
+        self._last = (None, None)
+
+    def _put(self, lru, key, value):
+        lru[key] = value
+        lru.move_to_end(key)
+        if len(lru) > self.maxsize:
+            lru.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, values):
+        """Return (True, solution) for a cached puzzle, with solution None if it has none, or (False, None)"""
+        key = tuple(values)
+        if key in self.exact:
+            self.exact.move_to_end(key)
+            self.hits += 1
+            return True, self.exact[key]
+        return self._lookup_canonical(values, key)
+
+    def _lookup_canonical(self, values, key):
+        found = canonical_form(values)
+        self._last = (key, found)
+        if found is not None:
+            form, transform = found
+            if form in self.canonical:
+                self.canonical.move_to_end(form)
+                solution = self.canonical[form]
+                self.canonical_hits += 1
+            elif self.disk is not None and form in self.disk:
+                solution = self.disk[form]
+                self._put(self.canonical, form, solution)
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                return False, None
+            solution = from_canonical(solution, transform) if solution is not None else None
+            self._put(self.exact, key, solution)
+            return True, solution
+        self.misses += 1
+        return False, None
+
+    def store(self, values, solution):
+        """Cache the solution (a list of cell values, or None) of the puzzle with the given cell values"""
+        key = tuple(values)
+        self._put(self.exact, key, solution)
+        found = self._last[1] if self._last[0] == key else canonical_form(values)
+        if found is not None:
+            form, transform = found
+            canonical = to_canonical(solution, transform) if solution is not None else None
+            self._put(self.canonical, form, canonical)
+            if self.disk is not None:
+                self.disk[form] = canonical
+
+    def solve(self, variables, domains, neighbors, assignment, *args, **kwargs):
+        """sudoku.solve through the cache: the givens in assignment are looked up in the exact tier first, then a probe
+        search is tried, and only a puzzle it does not decide is looked up by canonical form and searched in full.
+        When limits are passed, a search returns its SearchResult unchanged, and is cached only if it was not stopped
+        by a limit, and a hit returns a SearchResult of the cached answer."""
+        limits = kwargs.get('limits', args[5] if len(args) > 5 else None)
+        args, kwargs = args[:5], dict(kwargs)
+        values = [assignment.get(v, 0) for v in variables]
+        key = tuple(values)
+        found, solution = key in self.exact, self.exact.get(key)
+        if found:
+            self.exact.move_to_end(key)
+            self.hits += 1
+        else:
+            kwargs['limits'] = SearchLimits(limits.deadline if limits is not None else None, max_nodes=self.probe_nodes,
+                                            token=limits.token if limits is not None else None)
+            result = solve(variables, domains, neighbors, dict(assignment), *args, **kwargs)
+            if result.status != 'node_limit':
+                if result.status not in ('solved', 'unsatisfiable'):
+                    return result
+                self.probed += 1
+                solution = [result.assignment[v] for v in variables] if result.status == 'solved' else None
+                self._put(self.exact, key, solution)
+                if limits is not None:
+                    return result
+                found = True
+            else:
+                found, solution = self._lookup_canonical(values, key)
+        if found and limits is not None:
+            if solution is None:
+                return SearchResult('unsatisfiable', None, None, None)
+            return SearchResult('solved', {v: solution[i] for i, v in enumerate(variables)}, None, None)
+        if not found:
+            kwargs['limits'] = limits
+            result = solve(variables, domains, neighbors, dict(assignment), *args, **kwargs)
+            if isinstance(result, SearchResult):
+                if result.status in ('solved', 'unsatisfiable'):
+                    solution = result.assignment if result.status == 'solved' else None
+                    self.store(values, [solution[v] for v in variables] if solution is not None else None)
+                return result
+            solution = [result[v] for v in variables] if result is not None else None
+            self.store(values, solution)
+        return {v: solution[i] for i, v in enumerate(variables)} if solution is not None else None
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'canonical_hits': self.canonical_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'probed': self.probed,
+            'evictions': self.evictions,
+            'size': len(self.exact),
+            'canonical_size': len(self.canonical),
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
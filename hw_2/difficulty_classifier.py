@@ -1,28 +1,61 @@
 # difficulty_classifier.py
 
+import pickle
+import random
+import time
+
 import numpy as np
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.model_selection import StratifiedKFold
 from sklearn.model_selection import cross_val_score
 from sudoku_io import SudokuIO
-from utils import CSP
-from backtracking import equal_constraint, order_domain_values, mrv
-
-
-def recursive_backtracking_search(assignment, csp, guesses=[]):
-    if len(assignment) == len(csp.variables):
-        return sum(guesses)
-    var = mrv(assignment, csp)
-    values = order_domain_values(var, assignment, csp)
-    guesses.append(len(values) - 1)
-    for value in values:
-        if csp.nconflicts(var, value, assignment) == 0:
-            csp.assign(var, value, assignment)
-            result = recursive_backtracking_search(assignment, csp, guesses)
-            if result is not None:
-                return result
-            csp.unassign(var, assignment)
-    return None
+from sudoku_csp import SudokuCSP
+from backtracking import equal_constraint, order_domain_values, mrv, backtracking_search
+from alldiff import alldiff, propagate_units
+from stats import SolverStats
+from limits import SearchLimits, SearchStopped, finished, stopped
+from features import FeatureStore, read_labelled
+
+
+def recursive_backtracking_search(assignment, csp, guesses=None, stats=None, limits=None):
+    """Custom simple backtracking-search with mrv and no inference, returning the number of guesses made to reach a
+    solution, or None, which is also kept in csp.nguesses. Returns a SearchResult when limits are given."""
+    if guesses is None:
+        guesses = []
+
+    def backtrack(assignment):
+        if len(assignment) == len(csp.variables):
+            return assignment
+        var = mrv(assignment, csp)
+        if stats is not None:
+            stats.node(var, len(assignment))
+        if limits is not None:
+            limits.node(csp, assignment)
+        values = order_domain_values(var, assignment, csp)
+        guesses.append(len(values) - 1)
+        for value in values:
+            if csp.nconflicts(var, value, assignment) == 0:
+                csp.assign(var, value, assignment)
+                result = backtrack(assignment)
+                if result is not None:
+                    return result
+                csp.unassign(var, assignment)
+                if stats is not None:
+                    stats.backtracks += 1
+        return None
+
+    if limits is None:
+        result = backtrack(assignment)
+        csp.nguesses = sum(guesses)
+        return csp.nguesses if result is not None else None
+    stats = stats if stats is not None else SolverStats()
+    limits.start()
+    try:
+        return finished(backtrack(assignment), csp, stats)
+    except SearchStopped as e:
+        return stopped(e, stats)
+    finally:
+        csp.nguesses = sum(guesses)
 
 
 def get_init_domains(csp, assignment):
@@ -38,93 +71,169 @@ def get_init_domains(csp, assignment):
     return [len(v) for v in d.values()]
 
 
-def format_trn_data():
-    puzzles = {
-        '1-1': 1,
-        '1-2': 1,
-        '1-3': 1,
-        '1-4': 1,
-        '1-5': 1,
-        '2-1': 2,
-        '2-2': 2,
-        '2-3': 2,
-        '2-4': 2,
-        '2-5': 2,
-        '3-1': 3,
-        '3-2': 3,
-        '3-3': 3,
-        '3-4': 3,
-        '3-5': 3,
-        '4-1': 4,
-        '4-2': 4,
-        '4-3': 4,
-        '4-4': 4,
-        '4-5': 4,
-    }
-    trn_x = open('data/trn_x.txt', 'w')
-    trn_y = open('data/trn_y.txt', 'w')
-    for k, v in puzzles.items():
-        puzzle = SudokuIO(k)
-        sudoku = CSP(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint)
-        domain_sizes = get_init_domains(sudoku, puzzle.assignment)
-        guesses = recursive_backtracking_search(puzzle.assignment, sudoku)
-        features = domain_sizes + [guesses, ]
-        for j in range(len(features)):
-            if j != len(features) - 1:
-                trn_x.write(str(features[j]) + ', ')
-            else:
-                trn_x.write(str(features[j]) + '\n')
-        trn_y.write(str(v) + '\n')
-
-
-def format_tst_data():
-    puzzles = {
-        '001': 1,
-        '002': 1,
-        '010': 1,
-        '015': 1,
-        '025': 1,
-        '026': 2,
-        '048': 2,
-        '051': 2,
-        '062': 3,
-        '076': 4,
-        '081': 4,
-        '082': 4,
-        '090': 4,
-        '095': 4,
-        '099': 4,
-        '100': 4,
-    }
-    trn_x = open('data/tst_x.txt', 'w')
-    trn_y = open('data/tst_y.txt', 'w')
-    for k, v in puzzles.items():
-        puzzle = SudokuIO(k)
-        sudoku = CSP(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint)
-        domain_sizes = get_init_domains(sudoku, puzzle.assignment)
-        guesses = recursive_backtracking_search(puzzle.assignment, sudoku)
-        features = domain_sizes + [guesses, ]
-        for j in range(len(features)):
-            if j != len(features) - 1:
-                trn_x.write(str(features[j]) + ', ')
-            else:
-                trn_x.write(str(features[j]) + '\n')
-        trn_y.write(str(v) + '\n')
-
-
-def read_trn_data():
-    train_x = np.loadtxt('data/trn_x.txt', delimiter=', ', dtype=int)
-    train_y = np.loadtxt('data/trn_y.txt', delimiter=', ', dtype=int)
-    return train_x, train_y
+TRN_PUZZLES = {
+    '1-1': 1,
+    '1-2': 1,
+    '1-3': 1,
+    '1-4': 1,
+    '1-5': 1,
+    '2-1': 2,
+    '2-2': 2,
+    '2-3': 2,
+    '2-4': 2,
+    '2-5': 2,
+    '3-1': 3,
+    '3-2': 3,
+    '3-3': 3,
+    '3-4': 3,
+    '3-5': 3,
+    '4-1': 4,
+    '4-2': 4,
+    '4-3': 4,
+    '4-4': 4,
+    '4-5': 4,
+}
+
+TST_PUZZLES = {
+    '001': 1,
+    '002': 1,
+    '010': 1,
+    '015': 1,
+    '025': 1,
+    '026': 2,
+    '048': 2,
+    '051': 2,
+    '062': 3,
+    '076': 4,
+    '081': 4,
+    '082': 4,
+    '090': 4,
+    '095': 4,
+    '099': 4,
+    '100': 4,
+}
+
+FEATURE_STORE = 'data/features'
+FEATURE_VERSION = 2
+
+
+def puzzle_features(values):
+    """Custom feature vector of a puzzle: the initial domain size of every cell and the guesses of a search"""
+    puzzle = SudokuIO(values=values)
+    # seeded by the puzzle, so the random tie-breaking in mrv gives the same guesses whenever features are recomputed
+    sudoku = SudokuCSP(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint,
+                       rng=random.Random(bytes(values)))
+    domain_sizes = get_init_domains(sudoku, puzzle.assignment)
+    guesses = recursive_backtracking_search(dict(puzzle.assignment), sudoku)
+    return domain_sizes + [guesses, ]
+
+
+def feature_store():
+    return FeatureStore(FEATURE_STORE, puzzle_features, FEATURE_VERSION)
+
+
+def _puzzle_values(puzzles):
+    return [SudokuIO(k).vars for k in puzzles]
+
+
+def format_trn_data(processes=None):
+    return feature_store().update(_puzzle_values(TRN_PUZZLES), processes)
+
+
+def format_tst_data(processes=None):
+    return feature_store().update(_puzzle_values(TST_PUZZLES), processes)
+
+
+def read_trn_data(path=None, processes=None):
+    """Return the features and labels of the training puzzles, or of the labelled corpus at path, computing only the
+    features missing from the store"""
+    if path is None:
+        values, labels = _puzzle_values(TRN_PUZZLES), list(TRN_PUZZLES.values())
+    else:
+        values, labels = zip(*read_labelled(path))
+    store = feature_store()
+    store.update(values, processes)
+    return store.lookup(values), np.array(labels)
 
 
 def read_tst_data():
-    test_x = np.loadtxt('data/tst_x.txt', delimiter=', ', dtype=int)
-    return test_x
+    store = feature_store()
+    values = _puzzle_values(TST_PUZZLES)
+    store.update(values)
+    return store.lookup(values)
+
+
+CHEAP_FEATURE_STORE = 'data/cheap_features'
+CHEAP_FEATURE_VERSION = 1
+MODEL_PATH = 'data/difficulty_model.pkl'
+# every cell is a node of the probe search, so this allows two descents through a 9x9 grid
+PROBE_BUDGET = 162
+
+
+def cheap_features(values):
+    """Custom feature vector of a puzzle that costs a bounded amount of work: the initial domain size of every cell,
+    the cells left unsolved, the candidates left and whether a contradiction was found by propagation alone, and the
+    nodes, backtracks and depth reached by a search stopped after PROBE_BUDGET nodes, with whether it finished"""
+    puzzle = SudokuIO(values=values)
+    sudoku = SudokuCSP(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint)
+    domain_sizes = get_init_domains(sudoku, puzzle.assignment)
+    sudoku.support_pruning()
+    consistent = propagate_units(sudoku, range(len(sudoku.index.units)), sudoku.checkpoint())
+    sizes = [sudoku.popcount[d] for d in sudoku.curr_domains]
+    propagation = [sum(1 for n in sizes if n > 1), sum(sizes), int(not consistent)]
+
+    probe = SudokuCSP(puzzle.variables, puzzle.domains, puzzle.neighbors, equal_constraint)
+    result = backtracking_search(puzzle.assignment, probe, mrv, alldiff, True, verbose=False,
+                                 limits=SearchLimits(max_nodes=PROBE_BUDGET))
+    stats = result.stats
+    return domain_sizes + propagation + [stats.nodes, stats.backtracks, stats.max_depth, int(result.status == 'solved')]
+
+
+def cheap_feature_store():
+    return FeatureStore(CHEAP_FEATURE_STORE, cheap_features, CHEAP_FEATURE_VERSION)
+
+
+def train_predictor(path=None, model_path=MODEL_PATH, processes=None):
+    """Fit a classifier on the cheap features of the training puzzles, or of the labelled corpus at path, and save it
+    to model_path for DifficultyPredictor"""
+    if path is None:
+        values, labels = _puzzle_values(TRN_PUZZLES), list(TRN_PUZZLES.values())
+    else:
+        values, labels = zip(*read_labelled(path))
+    store = cheap_feature_store()
+    store.update(values, processes)
+    model = KNeighborsClassifier(n_neighbors=1)
+    model.fit(store.lookup(values), np.array(labels))
+    with open(model_path, 'wb') as file:
+        pickle.dump({'model': model, 'version': CHEAP_FEATURE_VERSION, 'probe_budget': PROBE_BUDGET}, file)
+    return model
+
+
+class DifficultyPredictor(object):
+    """Custom difficulty predictor loading a model saved by train_predictor. Every prediction, features included, is
+    timed, and latency(q) gives the q-th percentile of the prediction latencies so far in milliseconds."""
+
+    def __init__(self, model_path=MODEL_PATH):
+        with open(model_path, 'rb') as file:
+            saved = pickle.load(file)
+        if saved['version'] != CHEAP_FEATURE_VERSION or saved['probe_budget'] != PROBE_BUDGET:
+            raise ValueError('Model at {} was trained on other features, retrain it'.format(model_path))
+        self.model = saved['model']
+        self.latencies = []
+
+    def predict(self, values):
+        """Return the predicted difficulty class of a puzzle given as cell values"""
+        start = time.perf_counter()
+        label = int(self.model.predict(np.array([cheap_features(values)]))[0])
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return label
+
+    def latency(self, q=99):
+        return float(np.percentile(self.latencies, q)) if self.latencies else 0.0
 
 
-def build_classifier():
-    X, y = read_trn_data()
+def build_classifier(path=None):
+    X, y = read_trn_data(path)
     model = KNeighborsClassifier(n_neighbors=1)
     score = cross_val_score(model, X, y, cv=StratifiedKFold(n_splits=2), scoring='accuracy')
     mean_score = np.array(score).mean()
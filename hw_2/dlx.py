@@ -0,0 +1,165 @@
+# dlx.py
+
+"""
+Custom exact-cover engine. Sudoku is encoded as an exact-cover problem with one row per (cell, value) candidate and one
+column per constraint (cell filled, value in row, value in column, value in box), and solved with Knuth's Dancing Links
+(Algorithm X). The links are stored in flat integer lists indexed by node instead of Python objects per node: index 0 is
+the root, the next 4 * 81 indices (for a 9x9 grid) are the column headers and the rest are the nodes, four per
+candidate row. The full matrix of each grid size is built once and copied for every search.
+"""
+
+from sudoku_index import get_index, box_for
+from stats import SolverStats
+from limits import SearchStopped, SearchResult
+
+
+def _build_matrix(index):
+    """Build the left, right, up, down, column, row and size lists of the full exact-cover matrix of a grid"""
+    n = index.size
+    num_cols = 4 * index.num_cells
+    num_rows = index.num_cells * n
+    size = 1 + num_cols + 4 * num_rows
+    L = list(range(-1, size - 1))
+    R = list(range(1, size + 1))
+    L[0] = num_cols
+    R[num_cols] = 0
+    U = list(range(size))
+    D = list(range(size))
+    C = list(range(size))
+    ROW = [-1] * size
+    S = [0] * (num_cols + 1)
+    for cell in range(index.num_cells):
+        for d in range(n):
+            r = cell * n + d
+            first = 1 + num_cols + 4 * r
+            columns = (1 + cell,
+                       1 + index.num_cells + index.row_of[cell] * n + d,
+                       1 + 2 * index.num_cells + index.col_of[cell] * n + d,
+                       1 + 3 * index.num_cells + index.box_of[cell] * n + d)
+            for k, c in enumerate(columns):
+                x = first + k
+                L[x] = first + (k - 1) % 4
+                R[x] = first + (k + 1) % 4
+                U[x] = U[c]
+                D[x] = c
+                D[U[c]] = x
+                U[c] = x
+                C[x] = c
+                ROW[x] = r
+                S[c] += 1
+    return L, R, U, D, C, ROW, S
+
+
+_MATRICES = {}
+
+
+def get_matrix(box=3):
+    """Return the shared full exact-cover matrix of a grid made of box x box boxes"""
+    if box not in _MATRICES:
+        _MATRICES[box] = _build_matrix(get_index(box))
+    return _MATRICES[box]
+
+
+def dlx_search(a, csp, verbose=True, stats=None, limits=None):
+    """Custom implementation of Algorithm X over dancing links, instrumented like backtracking_search. The givens in a
+    and the values left in csp.domains fix the candidate rows; returns the complete assignment or None, and keeps the
+    number of rows selected in csp.nassigns and the number of guesses in csp.nguesses. Returns a SearchResult when
+    limits are given, whose curr_domains is None since dancing links keeps no domains."""
+    box = box_for(len(csp.variables))
+    L, R, U, D, C, ROW, S = (list(x) for x in get_matrix(box))
+    n = box * box
+    num_cols = len(S) - 1
+
+    def cover(c):
+        L[R[c]] = L[c]
+        R[L[c]] = R[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(c):
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        L[R[c]] = c
+        R[L[c]] = c
+
+    def search():
+        if R[0] == 0:
+            return True
+        c = best = R[0]
+        while c != 0:
+            if S[c] < S[best]:
+                best = c
+            c = R[c]
+        if S[best] == 0:
+            return False
+        if stats is not None:
+            stats.node(best, len(solution))
+        if limits is not None:
+            limits.node(csp, None)
+        guesses.append(S[best] - 1)
+        cover(best)
+        r = D[best]
+        while r != best:
+            solution.append(ROW[r])
+            csp.nassigns += 1
+            j = R[r]
+            while j != r:
+                cover(C[j])
+                j = R[j]
+            if search():
+                return True
+            j = L[r]
+            while j != r:
+                uncover(C[j])
+                j = L[j]
+            solution.pop()
+            if stats is not None:
+                stats.backtracks += 1
+            r = D[r]
+        uncover(best)
+        return False
+
+    # drop the candidate rows ruled out by the domains before any column is covered
+    for cell in csp.variables:
+        allowed = [a[cell]] if cell in a else csp.domains[cell]
+        for d in range(n):
+            if d + 1 not in allowed:
+                first = 1 + num_cols + 4 * (cell * n + d)
+                for x in range(first, first + 4):
+                    D[U[x]] = D[x]
+                    U[D[x]] = U[x]
+                    S[C[x]] -= 1
+
+    guesses = []
+    solution = []
+    if limits is None:
+        found = search()
+    else:
+        stats = stats if stats is not None else SolverStats()
+        limits.start()
+        try:
+            found = search()
+        except SearchStopped as e:
+            csp.nguesses = sum(guesses)
+            return SearchResult(e.status, {r // n: r % n + 1 for r in solution}, None, stats)
+    if not found:
+        return SearchResult('unsatisfiable', None, None, stats) if limits is not None else None
+    csp.nguesses = sum(guesses)
+    if verbose:
+        print('{} guesses'.format(csp.nguesses))
+    result = {r // n: r % n + 1 for r in solution}
+    return SearchResult('solved', result, None, stats) if limits is not None else result
@@ -0,0 +1,94 @@
+# features.py
+
+"""
+Custom feature store for the difficulty classifier. Feature vectors are kept as two .npy arrays in a directory, the
+puzzle keys (a SHA-1 of the cell values and the feature version) and one row of features per key, so they can be
+memory-mapped instead of parsed. update computes features for the puzzles whose key is not stored yet across a pool of
+worker processes, and appends them; puzzles that are already stored, under the same version, are never recomputed.
+"""
+
+import hashlib
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from sudoku_io import parse_grids
+
+KEY_DTYPE = 'U40'
+
+
+def puzzle_key(values, version=1):
+    """Return the key of a puzzle given as cell values, which changes with the puzzle or the feature version"""
+    return hashlib.sha1(bytes([version]) + bytes(values)).hexdigest()
+
+
+def read_labelled(path):
+    """Yield (values, label) pairs from a file with one puzzle per line, as an 81-character line followed by its integer
+    label"""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                puzzle, label = line.split()
+                yield parse_grids(puzzle)[0], int(label)
+
+
+class FeatureStore(object):
+    """Custom store of the features computed by extract, a module-level function mapping cell values to a list of
+    numbers, in the directory path. Bump version whenever extract changes so old rows are no longer matched."""
+
+    def __init__(self, path, extract, version=1):
+        self.path = path
+        self.extract = extract
+        self.version = version
+        self.keys = np.empty(0, dtype=KEY_DTYPE)
+        self.features = None
+        self.rows = {}
+        if os.path.exists(self._file('keys')):
+            self.keys = np.load(self._file('keys'), mmap_mode='r')
+            self.features = np.load(self._file('features'), mmap_mode='r')
+            self.rows = {k: i for i, k in enumerate(self.keys.tolist())}
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.npy')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, values):
+        return puzzle_key(values, self.version) in self.rows
+
+    def update(self, puzzles, processes=None, chunksize=64):
+        """Compute and store the features of every puzzle not stored yet, across processes workers (all cores by
+        default, inline for 1). Returns the number of puzzles computed."""
+        missing = {}
+        for values in puzzles:
+            key = puzzle_key(values, self.version)
+            if key not in self.rows:
+                missing[key] = list(values)
+        if not missing:
+            return 0
+        if processes == 1:
+            rows = [self.extract(values) for values in missing.values()]
+        else:
+            with Pool(processes) as pool:
+                rows = pool.map(self.extract, missing.values(), chunksize)
+        keys = np.array(list(missing), dtype=KEY_DTYPE)
+        rows = np.array(rows)
+        if self.features is not None:
+            keys = np.concatenate([self.keys, keys])
+            rows = np.concatenate([self.features, rows.astype(self.features.dtype)])
+        os.makedirs(self.path, exist_ok=True)
+        # write aside and rename, so an interrupted update leaves the previous store intact
+        for name, array in (('features', rows), ('keys', keys)):
+            np.save(self._file(name + '.tmp'), array)
+            os.replace(self._file(name + '.tmp'), self._file(name))
+        self.keys = np.load(self._file('keys'), mmap_mode='r')
+        self.features = np.load(self._file('features'), mmap_mode='r')
+        self.rows = {k: i for i, k in enumerate(self.keys.tolist())}
+        return len(missing)
+
+    def lookup(self, puzzles):
+        """Return the stored features of the puzzles as an array with one row per puzzle, in order"""
+        index = [self.rows[puzzle_key(values, self.version)] for values in puzzles]
+        return np.asarray(self.features[index])
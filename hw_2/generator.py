@@ -0,0 +1,173 @@
+# generator.py
+
+"""
+Custom generator of unique-solution puzzles sorted into the difficulty classes 1-4 of difficulty_classifier. Each
+puzzle starts from a random full grid, completed by dancing links from random diagonal boxes, and loses givens in a
+random order down to a random target, each removal kept only if the puzzle stays unique. The puzzles are then rated by
+DifficultyPredictor and appended to one puzzle file per class.
+
+A removal is checked incrementally: the puzzle is known to be unique, so after emptying a cell that held v, any other
+solution must put a different value there. The check is a single search for a solution with v taken out of the cell's
+domain, which stops at the first solution it finds and is usually refuted by propagation alone, instead of counting the
+solutions of the new puzzle from scratch.
+
+Puzzle i of a run with seed s depends on (s, i) only and the files are written in order of i, so a run is reproducible
+for any number of processes.
+
+Usage: python generator.py -n COUNT [-s SEED] [-p PROCESSES] [-o PATH] [--tiers TIER ...] [--min-givens N]
+                           [--max-givens N] [--max-puzzles N] [-m MODEL] [--grid]
+"""
+
+import argparse
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from sudoku_index import INDEX
+from sudoku_io import PuzzleWriter
+from sudoku_csp import SudokuCSP
+from dlx import dlx_search
+from difficulty_classifier import DifficultyPredictor, train_predictor, MODEL_PATH
+
+FULL_DOMAIN = list(range(1, INDEX.size + 1))
+
+# puzzles generated per puzzle wanted before generate gives up, unless max_puzzles is given
+PUZZLES_PER_WANTED = 1000
+
+_PREDICTOR = None
+
+
+def _sudoku(values, exclude=None):
+    """Return a SudokuCSP and the givens of cell values, with the value exclude = (cell, value) taken out of the domain
+    of an empty cell"""
+    domains = {i: [v] if v else FULL_DOMAIN for i, v in enumerate(values)}
+    if exclude is not None:
+        cell, value = exclude
+        domains[cell] = [v for v in FULL_DOMAIN if v != value]
+    csp = SudokuCSP(list(range(INDEX.num_cells)), domains, {i: INDEX.peers[i] for i in domains})
+    return csp, {i: v for i, v in enumerate(values) if v}
+
+
+def random_grid(rng):
+    """Return the cell values of a random full grid: the boxes on the diagonal, which share no unit, are filled with
+    random permutations and the rest is completed by dancing links"""
+    values = [0] * INDEX.num_cells
+    for k in range(INDEX.box):
+        for cell, v in zip(INDEX.boxes[k * (INDEX.box + 1)], rng.sample(FULL_DOMAIN, INDEX.size)):
+            values[cell] = v
+    csp, givens = _sudoku(values)
+    solution = dlx_search(givens, csp, verbose=False)
+    return [solution[i] for i in range(INDEX.num_cells)]
+
+
+def stays_unique(values, cell):
+    """Return True if the unique puzzle values keeps a unique solution once cell is emptied"""
+    reduced = list(values)
+    reduced[cell] = 0
+    csp, givens = _sudoku(reduced, (cell, values[cell]))
+    return dlx_search(givens, csp, verbose=False) is None
+
+
+def remove_givens(solution, rng, target):
+    """Empty the cells of a full grid in random order while the puzzle stays unique, down to target givens. Returns the
+    puzzle and the number of uniqueness checks made."""
+    values = list(solution)
+    cells = list(range(INDEX.num_cells))
+    rng.shuffle(cells)
+    givens = len(cells)
+    checks = 0
+    for cell in cells:
+        if givens <= target:
+            break
+        checks += 1
+        if stays_unique(values, cell):
+            values[cell] = 0
+            givens -= 1
+    return values, checks
+
+
+def _init_worker(model_path):
+    global _PREDICTOR
+    _PREDICTOR = DifficultyPredictor(model_path)
+
+
+def generate_one(task):
+    """Generate and rate puzzle i of the run seeded with seed"""
+    seed, i, min_givens, max_givens = task
+    rng = random.Random('{}-{}'.format(seed, i))
+    target = rng.randint(min_givens, max_givens)
+    puzzle, checks = remove_givens(random_grid(rng), rng, target)
+    return _PREDICTOR.predict(puzzle), puzzle, checks
+
+
+def generate(count, tiers=(1, 2, 3, 4), seed=0, processes=None, path='puzzles/generated_{}.txt', min_givens=22,
+             max_givens=36, max_puzzles=None, model_path=MODEL_PATH, grid=False):
+    """Generate puzzles until every tier in tiers has count of them, or max_puzzles were generated (PUZZLES_PER_WANTED
+    per puzzle wanted by default), and append each tier to path formatted with the tier. Returns the number written per
+    tier with the uniqueness checks made and their rate per second. Raises ValueError for tiers the model never
+    predicts."""
+    if not os.path.exists(model_path):
+        train_predictor(model_path=model_path)
+    classes = {int(c) for c in DifficultyPredictor(model_path).model.classes_}
+    unknown = sorted(set(tiers) - classes)
+    if unknown:
+        raise ValueError('The model never predicts tiers {}, only {}'.format(unknown, sorted(classes)))
+    if not tiers:
+        raise ValueError('No tiers to generate')
+    if max_puzzles is None:
+        max_puzzles = PUZZLES_PER_WANTED * count * len(tiers)
+    writers = {tier: PuzzleWriter(path.format(tier), grid) for tier in tiers}
+    written = {tier: 0 for tier in tiers}
+    checks = 0
+    generated = 0
+    start = time.perf_counter()
+    processes = processes or os.cpu_count()
+    with Pool(processes, _init_worker, (model_path,)) as pool:
+        while min(written.values()) < count and generated < max_puzzles:
+            # a round at a time, since imap would read an endless task iterator ahead without bound
+            size = min(16 * processes, max_puzzles - generated)
+            tasks = [(seed, i, min_givens, max_givens) for i in range(generated, generated + size)]
+            for tier, puzzle, n in pool.imap(generate_one, tasks, 4):
+                checks += n
+                if tier in writers and written[tier] < count:
+                    writers[tier].write(puzzle)
+                    written[tier] += 1
+            generated += size
+    for writer in writers.values():
+        writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        'written': written,
+        'generated': generated,
+        'checks': checks,
+        'checks_per_second': checks / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate unique-solution Sudoku puzzles by difficulty class.')
+    parser.add_argument('-n', '--count', type=int, required=True, help='puzzles wanted per class')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the run')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('-o', '--output', default='puzzles/generated_{}.txt',
+                        help='output file per class, {} is replaced by the class (.gz to compress)')
+    parser.add_argument('--tiers', type=int, nargs='+', default=[1, 2, 3, 4], help='classes to generate')
+    parser.add_argument('--min-givens', type=int, default=22, help='fewest givens to aim for')
+    parser.add_argument('--max-givens', type=int, default=36, help='most givens to aim for')
+    parser.add_argument('--max-puzzles', type=int, default=None,
+                        help='stop after generating this many puzzles (default: {} per puzzle wanted)'.format(
+                            PUZZLES_PER_WANTED))
+    parser.add_argument('-m', '--model', default=MODEL_PATH, help='difficulty model, trained first if missing')
+    parser.add_argument('--grid', action='store_true', help='write puzzles in the spaced grid format')
+    args = parser.parse_args()
+
+    summary = generate(args.count, args.tiers, args.seed, args.processes, args.output, args.min_givens,
+                       args.max_givens, args.max_puzzles, args.model, args.grid)
+    print('Wrote {} from {} puzzles, {} uniqueness checks ({:.1f}/s)'.format(
+        ', '.join('class {}: {}'.format(t, n) for t, n in sorted(summary['written'].items())), summary['generated'],
+        summary['checks'], summary['checks_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+# iterative.py
+
+"""
+Custom iterative version of backtracking_search. The recursion is replaced by an explicit stack of frames, one per
+search node, each holding the variable, its values in order, the position of the next value to try and the trail mark
+of the value being tried. The search runs a given number of nodes at a time, so a long solve can give way to an event
+loop or a scheduler between slices, and it is not bound by the recursion limit on larger grids.
+
+A paused search can be saved with checkpoint, as compressed bytes holding the givens and the variable, position and
+values of every frame, and continued with IterativeSearch.from_checkpoint in another process. Resuming replays the
+givens and the value of each frame with the same inference, which rebuilds the domains exactly, and picks up the search
+where it stopped. The values are saved rather than recomputed since a utils.CSP reorders its domains as it prunes and
+restores, so its open frames are rebuilt exactly but the values of later frames may come in another order.
+
+A running search can also give part of its tree away: split takes the untried values of its shallowest open frame and
+returns them with the decisions leading there, and IterativeSearch.from_split searches just that subtree, e.g. in an
+idle worker.
+"""
+
+import asyncio
+import sys
+import zlib
+from array import array
+from copy import copy
+
+from sudoku_index import get_index, box_for
+from sudoku_csp import SudokuCSP
+from stats import SolverStats
+from backtracking import order_domain_values, find_pairs, init_domains, mrv, mac
+from limits import SearchStopped, SearchResult
+
+CHECKPOINT_VERSION = 2
+RUNNING, SOLVED, UNSATISFIABLE = 0, 1, 2
+_STATUS = {RUNNING: 'running', SOLVED: 'solved', UNSATISFIABLE: 'unsatisfiable'}
+_STATUS_CODES = {status: code for code, status in _STATUS.items()}
+
+
+class IterativeSearch(object):
+    """Custom backtracking-search over csp from the givens in a, with the same heuristic, inference and all_methods as
+    backtracking_search, run in slices by step. status is 'running' until the search ends as 'solved', with the
+    solution in result, or 'unsatisfiable', or a SearchLimits status when limits stop it. A search stopped by limits
+    keeps its state, so it can still be checkpointed and resumed."""
+
+    def __init__(self, a, csp, heuristic=mrv, inference=mac, all_methods=False, verbose=True, stats=None, limits=None):
+        self.givens = dict(a)
+        self.csp = csp
+        self.heuristic = heuristic
+        self.inference = inference
+        self.all_methods = all_methods
+        self.verbose = verbose
+        self.stats = stats
+        self.limits = limits.start() if limits is not None else None
+        self.assignment = {}
+        self.stack = []
+        self.guesses = 0
+        self.status = 'running'
+        self.result = None
+        csp.nguesses = 0
+        if all_methods:
+            self._traced(init_domains, csp, self.givens)
+
+    def _traced(self, fn, *args):
+        """Call fn with stats attached to csp, adding its prunes to stats"""
+        csp = self.csp
+        csp.stats = self.stats
+        nprunes = csp.nprunes
+        try:
+            return fn(*args)
+        finally:
+            if self.stats is not None:
+                self.stats.prunes += csp.nprunes - nprunes
+            csp.stats = None
+
+    def _expand(self):
+        """Open a frame for the variable chosen at the current node"""
+        csp, assignment = self.csp, self.assignment
+        var = self.heuristic(assignment, csp)
+        if self.stats is not None:
+            self.stats.node(var, len(assignment))
+        if self.limits is not None:
+            self.limits.node(csp, assignment)
+        values = order_domain_values(var, assignment, csp)
+        self.guesses += len(values) - 1
+        self.stack.append([var, values, 0, None])
+
+    def _apply(self, var, value):
+        """Assign var = value with inference, returning its trail mark and whether inference succeeded"""
+        csp, assignment = self.csp, self.assignment
+        csp.assign(var, value, assignment)
+        removals = csp.suppose(var, value)
+        if self.all_methods:
+            find_pairs(csp, removals)
+        return removals, self.inference(csp, var, value, assignment, removals)
+
+    def _advance(self):
+        """Undo the value tried in the top frame and try its next ones, returning True on descending into a child or
+        False when the frame is exhausted and popped"""
+        csp, assignment = self.csp, self.assignment
+        frame = self.stack[-1]
+        var, values = frame[0], frame[1]
+        if frame[3] is not None:
+            csp.restore(frame[3])
+            frame[3] = None
+            if self.stats is not None:
+                self.stats.backtracks += 1
+        while frame[2] < len(values):
+            value = values[frame[2]]
+            frame[2] += 1
+            if csp.nconflicts(var, value, assignment) == 0:
+                removals, consistent = self._apply(var, value)
+                frame[3] = removals
+                if consistent:
+                    return True
+                csp.restore(removals)
+                frame[3] = None
+                if self.stats is not None:
+                    self.stats.backtracks += 1
+        csp.unassign(var, assignment)
+        self.stack.pop()
+        return False
+
+    def _run(self, k):
+        nodes = 0
+        expand = True
+        while True:
+            if expand:
+                if len(self.assignment) == len(self.csp.variables):
+                    self.status = 'solved'
+                    self.result = self.assignment
+                    self.csp.nguesses = self.guesses
+                    if self.verbose:
+                        print('{} guesses'.format(self.guesses))
+                    return
+                if k is not None and nodes == k:
+                    return
+                self._expand()
+                nodes += 1
+            expand = self._advance()
+            if not expand and not self.stack:
+                self.status = 'unsatisfiable'
+                return
+
+    def step(self, k=None):
+        """Run up to k more nodes (all of them if k is None) and return status"""
+        if self.status != 'running':
+            return self.status
+        try:
+            self._traced(self._run, k)
+        except SearchStopped as e:
+            self.status = e.status
+        self.csp.nguesses = self.guesses
+        return self.status
+
+    def slices(self, k):
+        """Generator running k nodes per iteration and yielding status until the search ends"""
+        while self.step(k) == 'running':
+            yield self.status
+
+    async def run_async(self, k=1000):
+        """Run to the end, giving way to the event loop every k nodes, and return result"""
+        while self.step(k) == 'running':
+            await asyncio.sleep(0)
+        return self.result
+
+    def search_result(self):
+        """Return the SearchResult of the search so far, with the givens included in a partial assignment"""
+        if self.status == 'unsatisfiable':
+            assignment = None
+        elif self.status == 'solved':
+            assignment = self.result
+        else:
+            assignment = {**self.givens, **self.assignment}
+        return SearchResult(self.status, assignment, copy(self.csp.curr_domains), self.stats)
+
+    def checkpoint(self):
+        """Return the state of the search as compact bytes for from_checkpoint"""
+        n = len(self.csp.variables)
+        status = _STATUS_CODES.get(self.status, RUNNING)
+        state = array('I', [CHECKPOINT_VERSION, n, status, int(self.all_methods), self.guesses, len(self.stack)])
+        state.extend(self.givens.get(v, 0) for v in range(n))
+        for var, values, position, _ in self.stack:
+            state.extend((var, position, len(values)))
+            state.extend(values)
+        if sys.byteorder == 'big':
+            state.byteswap()
+        return zlib.compress(state.tobytes())
+
+    @classmethod
+    def from_checkpoint(cls, data, csp=None, heuristic=mrv, inference=mac, verbose=True, stats=None, limits=None):
+        """Resume a search from checkpoint bytes, on csp or else a new SudokuCSP of the givens. csp must be built like
+        the one the checkpointed search ran on, with its variables numbered from 0, and inference must be the one it
+        used."""
+        state = array('I')
+        state.frombytes(zlib.decompress(data))
+        if sys.byteorder == 'big':
+            state.byteswap()
+        version, n, status, all_methods, guesses, depth = state[:6]
+        if version != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version {}'.format(version))
+        if status not in _STATUS:
+            raise ValueError('Checkpoint has an unknown status {}'.format(status))
+        values = state[6:6 + n]
+        givens = {v: values[v] for v in range(n) if values[v]}
+        if csp is None:
+            index = get_index(box_for(n))
+            full = list(range(1, index.size + 1))
+            csp = SudokuCSP(list(range(n)), {v: [givens[v]] if v in givens else full for v in range(n)},
+                            {v: index.peers[v] for v in range(n)})
+        search = cls(givens, csp, heuristic, inference, bool(all_methods), verbose, stats, limits)
+        i = 6 + n
+        for _ in range(depth):
+            var, position, length = state[i:i + 3]
+            values = tuple(state[i + 3:i + 3 + length])
+            i += 3 + length
+            if var >= n or not 0 < position <= length:
+                raise ValueError('Checkpoint does not match the puzzle')
+            search._replay(var, values, position)
+        search.guesses = guesses
+        search.status = _STATUS[status]
+        if status == SOLVED:
+            search.result = search.assignment
+        csp.nguesses = guesses
+        return search
+
+    def _replay(self, var, values, position):
+        """Push a frame for var that has tried values up to position, applying the last of them"""
+        removals, consistent = self._traced(self._apply, var, values[position - 1])
+        if not consistent:
+            raise ValueError('Checkpoint does not match the puzzle')
+        self.stack.append([var, values, position, removals])
+
+    def decisions(self):
+        """Return the (variable, value) pairs assigned by the open frames, from the root down"""
+        return [(var, values[position - 1]) for var, values, position, _ in self.stack]
+
+    def split(self):
+        """Give away the untried values of the shallowest frame that has any, returning (path, var, values) where path
+        is the list of decisions above that frame, or None if every frame is on its last value"""
+        for i, frame in enumerate(self.stack):
+            var, values, position, _ = frame
+            if position < len(values):
+                frame[1] = values[:position]
+                return self.decisions()[:i], var, values[position:]
+        return None
+
+    @classmethod
+    def from_split(cls, a, csp, path, var, values, heuristic=mrv, inference=mac, all_methods=False, verbose=True,
+                   stats=None, limits=None):
+        """Return a search of the subtree given by split: the decisions in path are replayed as frames with no other
+        value, and var takes the given values under them"""
+        search = cls(a, csp, heuristic, inference, all_methods, verbose, stats, limits)
+        for v, value in path:
+            search._replay(v, (value,), 1)
+        search.stack.append([var, tuple(values), 0, None])
+        # try the first values now, leaving the search at a node to expand as step expects
+        while not search._traced(search._advance):
+            if not search.stack:
+                search.status = 'unsatisfiable'
+                break
+        return search
+
+
+def iterative_search(a, csp, heuristic, inference, all_methods, verbose=True, stats=None, limits=None):
+    """Custom drop-in for backtracking_search run by IterativeSearch to the end. Returns a SearchResult when limits are
+    given."""
+    if limits is not None and stats is None:
+        stats = SolverStats()
+    search = IterativeSearch(a, csp, heuristic, inference, all_methods, verbose, stats, limits)
+    search.step()
+    if limits is not None:
+        return search.search_result()
+    return search.result
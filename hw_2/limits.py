@@ -0,0 +1,69 @@
+# limits.py
+
+"""
+Custom search limits. A SearchLimits object can be passed to any search function as limits to bound it by a deadline,
+a maximum number of nodes and a cancellation token (any object with is_set(), such as a threading.Event or a
+multiprocessing.Event set from another thread or process). The limits are checked at every node, which costs a counter
+increment, a flag read and a clock read against nodes that cost microseconds or more. A search given limits returns a
+SearchResult instead of its usual value, with status 'solved', 'unsatisfiable', 'timeout', 'node_limit' or 'cancelled'.
+When a limit stopped the search, the result holds the partial assignment and a copy of csp.curr_domains at the node
+where it stopped, and the csp is left as it was at that node.
+"""
+
+import time
+from collections import namedtuple
+from copy import copy
+
+SearchResult = namedtuple('SearchResult', ['status', 'assignment', 'curr_domains', 'stats'])
+
+
+class SearchStopped(Exception):
+    """Raised inside a search when a limit is reached, carrying the state at that node"""
+
+    def __init__(self, status, assignment=None, curr_domains=None):
+        super().__init__(status)
+        self.status = status
+        self.assignment = assignment
+        self.curr_domains = curr_domains
+
+
+class SearchLimits(object):
+    """Limits for one search at a time: a deadline in time.monotonic() seconds, or a timeout in seconds from now (the
+    earlier wins), a maximum number of nodes and a cancellation token. nodes counts the nodes of the current search."""
+    __slots__ = ('deadline', 'max_nodes', 'token', 'nodes')
+
+    def __init__(self, deadline=None, timeout=None, max_nodes=None, token=None):
+        if timeout is not None:
+            end = time.monotonic() + timeout
+            deadline = end if deadline is None else min(deadline, end)
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.token = token
+        self.nodes = 0
+
+    def start(self):
+        self.nodes = 0
+        return self
+
+    def node(self, csp, assignment):
+        """Count a node, and raise SearchStopped if a limit is reached"""
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.stop('node_limit', csp, assignment)
+        if self.token is not None and self.token.is_set():
+            self.stop('cancelled', csp, assignment)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stop('timeout', csp, assignment)
+
+    def stop(self, status, csp, assignment):
+        raise SearchStopped(status, dict(assignment) if assignment is not None else None, copy(csp.curr_domains))
+
+
+def finished(result, csp, stats):
+    """Return the SearchResult of a search that ran to completion with result"""
+    return SearchResult('solved' if result is not None else 'unsatisfiable', result, copy(csp.curr_domains), stats)
+
+
+def stopped(error, stats):
+    """Return the SearchResult of a search stopped by error"""
+    return SearchResult(error.status, error.assignment, error.curr_domains, stats)
@@ -0,0 +1,239 @@
+# portfolio.py
+
+"""
+Custom parallel solving of a single hard puzzle, for the latency of the hard tail rather than batch throughput.
+
+race runs a portfolio of strategies in one process each: MAC alone, MAC with find_pairs and init_domains, dancing links
+and MAC under differently seeded random MRV tie-breaking. The first strategy to finish answers, and the rest are
+cancelled through the token of their SearchLimits.
+
+split_solve divides the search tree of one strategy instead. The values of the top MRV variable are queued as separate
+subtrees, and every worker searches one at a time with IterativeSearch, a slice of nodes at a time. Between slices, a
+worker that sees an idle worker and an empty queue splits off the untried values of its shallowest frame and queues
+them, so work moves to idle workers until the tree is exhausted or a solution is found.
+
+Usage: python portfolio.py PUZZLE [--split] [-p PROCESSES] [-t TIMEOUT] [--box BOX]
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import time
+from collections import namedtuple
+from multiprocessing import get_context
+
+from board import Board
+from sudoku_io import parse_grids, iter_puzzles
+from sudoku_csp import SudokuCSP
+from backtracking import backtracking_search, mrv, mac
+from dlx import dlx_search
+from iterative import IterativeSearch
+from limits import SearchLimits
+
+Strategy = namedtuple('Strategy', ['engine', 'all_methods', 'seed'])
+
+# seconds between checks on the workers while waiting for an answer
+POLL_INTERVAL = 0.05
+
+BASE_STRATEGIES = (
+    Strategy('backtracking', False, None),
+    Strategy('backtracking', True, None),
+    Strategy('dlx', False, None),
+)
+
+
+def strategies(n):
+    """Return a portfolio of n strategies: the base strategies, then MAC with and without find_pairs under seeded
+    random tie-breaking"""
+    portfolio = list(BASE_STRATEGIES[:n])
+    seed = 1
+    while len(portfolio) < n:
+        portfolio.append(Strategy('backtracking', seed % 2 == 1, seed))
+        seed += 1
+    return portfolio
+
+
+def _race_worker(values, strategy, token, results):
+    board = Board.from_values(values)
+    csp = SudokuCSP.from_board(board, rng=random.Random(strategy.seed) if strategy.seed is not None else None)
+    limits = SearchLimits(token=token)
+    if strategy.engine == 'dlx':
+        result = dlx_search(board, csp, verbose=False, limits=limits)
+    else:
+        result = backtracking_search(board, csp, mrv, mac, strategy.all_methods, verbose=False, limits=limits)
+    solution = [result.assignment[v] for v in csp.variables] if result.status == 'solved' else None
+    results.put((strategy, result.status, solution, result.stats.nodes))
+
+
+def _finish(processes, token):
+    """Cancel the workers still searching and wait for them, terminating any that do not stop"""
+    token.set()
+    for process in processes:
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def _get(results, workers, deadline):
+    """Return the next answer put on results by workers, or None at deadline (a time.perf_counter time, or None to wait
+    for ever). Raises ChildProcessError if a worker has exited with an error, as it will never answer."""
+    while True:
+        wait = POLL_INTERVAL
+        if deadline is not None:
+            wait = min(wait, deadline - time.perf_counter())
+            if wait <= 0:
+                return None
+        try:
+            return results.get(timeout=wait)
+        except queue.Empty:
+            pass
+        for worker in workers:
+            if worker.exitcode:
+                raise ChildProcessError('worker exited with code {}'.format(worker.exitcode))
+
+
+def race(values, portfolio=None, processes=None, timeout=None):
+    """Solve the puzzle with cell values by racing the strategies in portfolio (strategies(processes) by default, for
+    all cores) and return the first answer as a dict with its status, solution, strategy and search nodes. The status
+    is 'error', with the reason in error, if a worker fails."""
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    portfolio = portfolio or strategies(processes or os.cpu_count())
+    context = get_context()
+    token = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=_race_worker, args=(values, strategy, token, results), daemon=True)
+               for strategy in portfolio]
+    for worker in workers:
+        worker.start()
+    answer = {'status': 'timeout', 'solution': None, 'strategy': None, 'nodes': None}
+    try:
+        for _ in workers:
+            item = _get(results, workers, deadline)
+            if item is None:
+                break
+            strategy, status, solution, nodes = item
+            answer = {'status': status, 'solution': solution, 'strategy': strategy._asdict(), 'nodes': nodes}
+            if status in ('solved', 'unsatisfiable'):
+                break
+    except ChildProcessError as e:
+        answer = {'status': 'error', 'solution': None, 'strategy': None, 'nodes': None, 'error': str(e)}
+    finally:
+        _finish(workers, token)
+    answer['time'] = time.perf_counter() - start
+    return answer
+
+
+def _root(values, all_methods):
+    """Return the subtrees at the values of the top MRV variable as (path, var, values) work items, or the answer if
+    the puzzle is decided before any choice"""
+    board = Board.from_values(values)
+    search = IterativeSearch(board, SudokuCSP.from_board(board), mrv, mac, all_methods, verbose=False)
+    status = search.step(1)
+    if status != 'running':
+        return status, search.result, []
+    (var, value), = search.decisions()
+    rest = search.split()
+    return status, None, [([], var, (v,)) for v in (value,) + tuple(rest[2] if rest else ())]
+
+
+def _split_worker(values, all_methods, slice_nodes, work, results, pending, idle, splits, token):
+    board = Board.from_values(values)
+    waiting = False
+    while not token.is_set():
+        if not waiting:
+            waiting = True
+            with idle.get_lock():
+                idle.value += 1
+        try:
+            path, var, choices = work.get(timeout=0.01)
+        except queue.Empty:
+            continue
+        waiting = False
+        with idle.get_lock():
+            idle.value -= 1
+        csp = SudokuCSP.from_board(board)
+        search = IterativeSearch.from_split(board, csp, path, var, choices, mrv, mac, all_methods, verbose=False,
+                                            limits=SearchLimits(token=token))
+        while search.step(slice_nodes) == 'running':
+            if idle.value > 0 and work.empty():
+                item = search.split()
+                if item is not None:
+                    with pending.get_lock():
+                        pending.value += 1
+                    with splits.get_lock():
+                        splits.value += 1
+                    work.put(item)
+        if search.status == 'solved':
+            results.put(('solved', [search.result[v] for v in csp.variables]))
+            return
+        if search.status == 'cancelled':
+            return
+        with pending.get_lock():
+            pending.value -= 1
+            if pending.value == 0:
+                results.put(('unsatisfiable', None))
+
+
+def split_solve(values, processes=None, all_methods=True, slice_nodes=64, timeout=None):
+    """Solve the puzzle with cell values by splitting its search tree across processes workers (all cores by default)
+    with work stealing, and return a dict with its status, solution, and the number of subtrees given away. The status
+    is 'error', with the reason in error, if a worker fails."""
+    start = time.perf_counter()
+    status, solution, items = _root(values, all_methods)
+    if not items:
+        solution = [solution[v] for v in range(len(values))] if solution is not None else None
+        return {'status': status, 'solution': solution, 'splits': 0, 'time': time.perf_counter() - start}
+    context = get_context()
+    token = context.Event()
+    work = context.Queue()
+    results = context.Queue()
+    pending = context.Value('i', len(items))
+    idle = context.Value('i', 0)
+    splits = context.Value('i', 0)
+    for item in items:
+        work.put(item)
+    workers = [context.Process(target=_split_worker, daemon=True,
+                               args=(values, all_methods, slice_nodes, work, results, pending, idle, splits, token))
+               for _ in range(processes or os.cpu_count())]
+    for worker in workers:
+        worker.start()
+    answer = {'status': 'timeout', 'solution': None}
+    try:
+        item = _get(results, workers, None if timeout is None else start + timeout)
+        if item is not None:
+            answer = {'status': item[0], 'solution': item[1]}
+    except ChildProcessError as e:
+        answer = {'status': 'error', 'solution': None, 'error': str(e)}
+    finally:
+        _finish(workers, token)
+    answer['splits'] = splits.value
+    answer['time'] = time.perf_counter() - start
+    return answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve one hard Sudoku puzzle on all cores.')
+    parser.add_argument('puzzle', help='puzzle file, or the puzzle itself in the line format')
+    parser.add_argument('--split', action='store_true', help='split the search tree instead of racing strategies')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('-t', '--timeout', type=float, default=None, help='time limit in seconds')
+    parser.add_argument('--box', type=int, default=3, help='box size of the grid, e.g. 4 for 16x16 (default: 3)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.puzzle):
+        values = next(iter_puzzles(args.puzzle, args.box))
+    else:
+        values = parse_grids(args.puzzle, args.box)[0]
+    if args.split:
+        answer = split_solve(values, args.processes, timeout=args.timeout)
+    else:
+        answer = race(values, processes=args.processes, timeout=args.timeout)
+    print(json.dumps(answer))
+
+
+if __name__ == '__main__':
+    main()
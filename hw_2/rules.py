@@ -0,0 +1,261 @@
+# rules.py
+
+"""
+Custom engine of human-style inference rules for SudokuCSP, stronger than find_pairs and run incrementally. The rules
+are ordered and can be switched on individually:
+
+    hidden_singles, naked_pairs, hidden_pairs, naked_triples, hidden_triples, pointing, claiming, x_wing
+
+A RuleEngine is an inference function for backtracking_search. It first runs a base inference (alldiff by default),
+then re-examines only the units whose cells lost values since its last pass, which it reads off the SudokuCSP undo
+trail, and alternates rules and unit propagation until nothing changes. Every removal goes through csp.prune_mask, so
+it lands on the same trail that csp.restore unwinds, and the number of values each rule removed is kept in hits.
+"""
+
+from itertools import combinations
+
+from sudoku_csp import SudokuCSP
+from alldiff import alldiff, propagate_units
+from stats import timed_phase
+
+
+def hidden_singles(csp, units, removals):
+    """A value with a single place left in a unit goes there"""
+    domains = csp.curr_domains
+    index = csp.index
+    for u in units:
+        once = twice = 0
+        for c in index.units[u]:
+            twice |= once & domains[c]
+            once |= domains[c]
+        singles = once & ~twice
+        if singles:
+            for c in index.units[u]:
+                d = domains[c]
+                if d & singles and csp.popcount[d] > 1:
+                    csp.prune_mask(c, d & ~singles, removals)
+
+
+def _naked_subsets(csp, units, removals, k):
+    domains = csp.curr_domains
+    popcount = csp.popcount
+    for u in units:
+        cells = csp.index.units[u]
+        candidates = [c for c in cells if 2 <= popcount[domains[c]] <= k]
+        for subset in combinations(candidates, k):
+            union = 0
+            for c in subset:
+                union |= domains[c]
+            if popcount[union] == k:
+                for c in cells:
+                    if c not in subset and domains[c] & union:
+                        csp.prune_mask(c, domains[c] & union, removals)
+
+
+def _hidden_subsets(csp, units, removals, k):
+    domains = csp.curr_domains
+    size = csp.size
+    popcount = csp.popcount
+    for u in units:
+        cells = csp.index.units[u]
+        # positions[v] is the mask of the places in the unit that still allow value v + 1
+        positions = [0] * size
+        for i, c in enumerate(cells):
+            for v in csp.mask_values[domains[c]]:
+                positions[v - 1] |= 1 << i
+        values = [v for v in range(size) if 2 <= popcount[positions[v]] <= k]
+        for subset in combinations(values, k):
+            places = 0
+            keep = 0
+            for v in subset:
+                places |= positions[v]
+                keep |= 1 << v
+            if popcount[places] == k:
+                for i, c in enumerate(cells):
+                    if places >> i & 1 and domains[c] & ~keep:
+                        csp.prune_mask(c, domains[c] & ~keep, removals)
+
+
+def naked_pairs(csp, units, removals):
+    """Two cells of a unit with the same two values take them from the rest of the unit"""
+    _naked_subsets(csp, units, removals, 2)
+
+
+def naked_triples(csp, units, removals):
+    """Three cells of a unit whose values span only three values take them from the rest of the unit"""
+    _naked_subsets(csp, units, removals, 3)
+
+
+def hidden_pairs(csp, units, removals):
+    """Two values confined to the same two cells of a unit clear every other value from those cells"""
+    _hidden_subsets(csp, units, removals, 2)
+
+
+def hidden_triples(csp, units, removals):
+    """Three values confined to the same three cells of a unit clear every other value from those cells"""
+    _hidden_subsets(csp, units, removals, 3)
+
+
+def pointing(csp, units, removals):
+    """A value confined to one row or column within a box is removed from the rest of that line"""
+    domains = csp.curr_domains
+    index = csp.index
+    size = csp.size
+    for u in units:
+        if u < 2 * size:
+            continue
+        for v in range(size):
+            bit = 1 << v
+            places = [c for c in index.units[u] if domains[c] & bit]
+            if len(places) < 2:
+                continue
+            for line_of, lines in ((index.row_of, index.rows), (index.col_of, index.cols)):
+                line = line_of[places[0]]
+                if all(line_of[c] == line for c in places):
+                    for c in lines[line]:
+                        if index.box_of[c] != u - 2 * size and domains[c] & bit:
+                            csp.prune_mask(c, bit, removals)
+
+
+def claiming(csp, units, removals):
+    """A value confined to one box within a row or column is removed from the rest of that box"""
+    domains = csp.curr_domains
+    index = csp.index
+    size = csp.size
+    for u in units:
+        if u >= 2 * size:
+            continue
+        cells = index.units[u]
+        for v in range(size):
+            bit = 1 << v
+            places = [c for c in cells if domains[c] & bit]
+            if len(places) < 2:
+                continue
+            box = index.box_of[places[0]]
+            if all(index.box_of[c] == box for c in places):
+                for c in index.boxes[box]:
+                    if c not in cells and domains[c] & bit:
+                        csp.prune_mask(c, bit, removals)
+
+
+def x_wing(csp, units, removals):
+    """A value confined to the same two columns in two rows is removed from the rest of those columns, and likewise
+    with rows and columns swapped. Only patterns through a touched line are checked."""
+    domains = csp.curr_domains
+    index = csp.index
+    size = csp.size
+    for base, cover, offset in ((index.rows, index.cols, 0), (index.cols, index.rows, size)):
+        touched = [u - offset for u in units if offset <= u < offset + size]
+        if not touched:
+            continue
+        for v in range(size):
+            bit = 1 << v
+            # places[line] is the mask of positions along the line that still allow the value
+            places = [0] * size
+            for line, cells in enumerate(base):
+                for i, c in enumerate(cells):
+                    if domains[c] & bit:
+                        places[line] |= 1 << i
+            for line in touched:
+                if csp.popcount[places[line]] != 2:
+                    continue
+                for other in range(size):
+                    if other != line and places[other] == places[line]:
+                        for i in range(size):
+                            if places[line] >> i & 1:
+                                for j, c in enumerate(cover[i]):
+                                    if j != line and j != other and domains[c] & bit:
+                                        csp.prune_mask(c, bit, removals)
+
+
+RULES = {
+    'hidden_singles': hidden_singles,
+    'naked_pairs': naked_pairs,
+    'hidden_pairs': hidden_pairs,
+    'naked_triples': naked_triples,
+    'hidden_triples': hidden_triples,
+    'pointing': pointing,
+    'claiming': claiming,
+    'x_wing': x_wing,
+}
+
+
+class RuleEngine(object):
+    """Inference function applying the named rules (all of them by default), always in the order of RULES, after the
+    base inference. Works on a SudokuCSP only, since it reads the undo trail."""
+
+    def __init__(self, rules=None, inference=alldiff):
+        names = list(RULES) if rules is None else rules
+        for name in names:
+            if name not in RULES:
+                raise ValueError('Unknown rule: {}'.format(name))
+        self.rules = [(name, RULES[name]) for name in RULES if name in names]
+        self.inference = inference
+        self.hits = {name: 0 for name, _ in self.rules}
+        self._csp = None
+        self._passes = []
+
+    def enable(self, name):
+        if name not in RULES:
+            raise ValueError('Unknown rule: {}'.format(name))
+        names = [n for n, _ in self.rules] + [name]
+        self.rules = [(n, RULES[n]) for n in RULES if n in names]
+        self.hits.setdefault(name, 0)
+
+    def disable(self, name):
+        self.rules = [(n, rule) for n, rule in self.rules if n != name]
+
+    def __call__(self, csp, var, value, assignment, removals):
+        if not isinstance(csp, SudokuCSP):
+            raise TypeError('RuleEngine needs a SudokuCSP, got {}'.format(type(csp).__name__))
+        if not self.inference(csp, var, value, assignment, removals):
+            return False
+        return self.run(csp, removals)
+
+    def _resume(self, csp):
+        """Return the trail position of the last pass still valid after any restores, or 0 for a full pass"""
+        if self._csp is not csp:
+            self._csp = csp
+            self._passes = []
+        trail = csp.trail
+        while self._passes:
+            pos, entry = self._passes[-1]
+            if pos <= len(trail) and (pos == 0 or trail[pos - 1] is entry):
+                return pos
+            self._passes.pop()
+        return -1
+
+    def run(self, csp, removals):
+        """Apply the rules to the units touched since the last pass until nothing changes"""
+        return run_rules(csp, self, removals)
+
+
+@timed_phase('rules')
+def run_rules(csp, engine, removals):
+    """Custom implementation of one incremental pass of a RuleEngine, see RuleEngine.run"""
+    trail = csp.trail
+    domains = csp.curr_domains
+    start = engine._resume(csp)
+    index = csp.index
+    units = range(len(index.units)) if start < 0 else None
+    start = max(start, 0)
+    while True:
+        if units is None:
+            units = sorted({u for var, _ in trail[start:] for u in index.unit_ids_of[var]})
+        if not units:
+            break
+        start = len(trail)
+        for name, rule in engine.rules:
+            before = csp.nprunes
+            rule(csp, units, removals)
+            if csp.nprunes != before:
+                engine.hits[name] += csp.nprunes - before
+                if 0 in domains:
+                    return False
+        if len(trail) > start:
+            touched = {u for var, _ in trail[start:] for u in index.unit_ids_of[var]}
+            if not propagate_units(csp, touched, removals):
+                return False
+        units = None
+    engine._passes.append((len(trail), trail[-1] if trail else None))
+    return True
@@ -0,0 +1,292 @@
+# service.py
+
+"""
+Custom long-running solve service. Requests are JSON lines read from stdin, a Unix socket or a local TCP port, such as
+
+    {"id": 7, "puzzle": "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......"}
+
+where puzzle is in the SudokuIO grid or line format (box gives the box size of larger grids, up to 5), and engine and
+timeout optionally choose the solver and a time limit in seconds. Each puzzle is answered with one JSON line carrying
+its id, status and solution, in the order the puzzles complete. A line {"stats": true} is answered with the throughput
+and the latency percentiles so far.
+
+Puzzles wait in a bounded queue; once it is full, reading stops until the workers catch up, so overload slows clients
+down instead of filling memory. Queued puzzles are taken in micro-batches of up to batch_size, or whatever arrived
+within batch_delay seconds, and each batch is solved in one call to a pool of worker processes started once for the
+life of the service. If a worker dies, the batches it held are answered with errors and the pool is started again.
+
+Usage: python service.py [--socket PATH | --port PORT] [-p PROCESSES] [-q QUEUE_SIZE] [-b BATCH_SIZE]
+                         [-d BATCH_DELAY] [-e ENGINE] [-t TIMEOUT]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import numpy as np
+
+from sudoku_io import parse_grids, format_line
+from batch import solve_values, ENGINES
+
+# box sizes of the grids accepted, as far as the line format has digits for
+BOXES = (2, 3, 4, 5)
+
+
+def _warm_up():
+    return True
+
+
+def _solve_task(values, engine, timeout):
+    try:
+        return solve_values(values, True, engine, timeout)
+    except Exception as e:
+        return {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def _solve_tasks(tasks):
+    """Solve a micro-batch of (values, engine, timeout) tasks in a worker, each failing on its own"""
+    return [_solve_task(values, engine, timeout) for values, engine, timeout in tasks]
+
+
+class SolveService(object):
+    """Custom service core shared by every connection: a bounded queue of puzzles, a batcher feeding a process pool
+    and the latencies of the last latency_window puzzles, from arrival to answer"""
+
+    def __init__(self, processes=None, queue_size=1024, batch_size=16, batch_delay=0.002, engine='backtracking',
+                 timeout=None, latency_window=10000):
+        self.processes = processes or os.cpu_count()
+        self.pool = self._new_pool()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.engine = engine
+        self.timeout = timeout
+        self.queue = None
+        self.inflight = None
+        self.latencies = deque(maxlen=latency_window)
+        self.received = 0
+        self.completed = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self._batcher = None
+
+    def _new_pool(self):
+        # spawned rather than forked, so workers started while clients are connected do not hold their sockets open
+        return ProcessPoolExecutor(self.processes, get_context('spawn'))
+
+    async def start(self):
+        """Start the batcher and the workers, which import the solver once here rather than on the first puzzles"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, _warm_up) for _ in range(self.processes)])
+        self.started = time.perf_counter()
+        self.queue = asyncio.Queue(self.queue_size)
+        # at most two batches per worker in flight, so the queue and not the pool absorbs the backlog
+        self.inflight = asyncio.Semaphore(2 * self.processes)
+        self._batcher = asyncio.ensure_future(self._run_batcher())
+
+    async def stop(self):
+        self._batcher.cancel()
+        self.pool.shutdown()
+
+    async def submit(self, values, engine=None, timeout=None):
+        """Queue a puzzle, waiting while the queue is full, and return a future of its result"""
+        future = asyncio.get_running_loop().create_future()
+        self.received += 1
+        engine = self.engine if engine is None else engine
+        timeout = self.timeout if timeout is None else timeout
+        await self.queue.put(((values, engine, timeout), future, time.perf_counter()))
+        return future
+
+    async def _run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            end = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self.inflight.acquire()
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        pool = self.pool
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(pool, _solve_tasks,
+                                                                       [task for task, _, _ in batch])
+        except BrokenProcessPool as e:
+            # batches in flight on the broken pool all fail here, and the first of them replaces it
+            if self.pool is pool:
+                self.pool = self._new_pool()
+                pool.shutdown(wait=False)
+            results = [{'status': 'error', 'error': 'BrokenProcessPool: {}'.format(e)}] * len(batch)
+        except Exception as e:
+            results = [{'status': 'error', 'error': str(e)}] * len(batch)
+        finally:
+            self.inflight.release()
+        self.batches += 1
+        now = time.perf_counter()
+        for (_, future, arrived), result in zip(batch, results):
+            self.latencies.append((now - arrived) * 1000)
+            self.completed += 1
+            if not future.cancelled():
+                future.set_result(result)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        return {
+            'received': self.received,
+            'completed': self.completed,
+            'queued': self.queue.qsize(),
+            'batches': self.batches,
+            'throughput': self.completed / elapsed if elapsed else 0.0,
+            'latency_ms': {'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(latencies.max())},
+        }
+
+
+def _response(request_id, result):
+    response = {'id': request_id, 'status': result['status']}
+    if result.get('solution') is not None:
+        response['solution'] = format_line(result['solution']).rstrip()
+    if 'error' in result:
+        response['error'] = result['error']
+    else:
+        response['time'] = result['time']
+        response['nassigns'] = result['nassigns']
+        response['guesses'] = result['guesses']
+    return response
+
+
+def _options(request):
+    """Return the box size, engine and timeout of a request, None where not given (3 for box), raising ValueError if
+    they are invalid"""
+    box = request.get('box', 3)
+    if isinstance(box, bool) or not isinstance(box, int) or box not in BOXES:
+        raise ValueError('Invalid box {!r}, expected one of {}'.format(box, ', '.join(map(str, BOXES))))
+    engine = request.get('engine')
+    if engine is not None and engine not in ENGINES:
+        raise ValueError('Unknown engine {!r}, expected one of {}'.format(engine, ', '.join(ENGINES)))
+    timeout = request.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout < 0):
+        raise ValueError('Invalid timeout {!r}, expected a non-negative number of seconds'.format(timeout))
+    return box, engine, timeout
+
+
+async def serve_lines(service, readline, writer):
+    """Answer the JSON line requests read by readline on writer until end of input, then wait for the puzzles still
+    being solved"""
+    pending = set()
+
+    def write(response):
+        writer.write((json.dumps(response) + '\n').encode())
+
+    def answer(request_id, future):
+        pending.discard(future)
+        write(_response(request_id, future.result()))
+
+    while True:
+        line = await readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('stats'):
+                write(service.stats())
+                continue
+            box, engine, timeout = _options(request)
+            grids = parse_grids(request['puzzle'], box)
+            if not grids:
+                raise ValueError('Incomplete puzzle')
+            future = await service.submit(grids[0], engine, timeout)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            write({'id': request_id, 'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)})
+            continue
+        pending.add(future)
+        future.add_done_callback(lambda f, request_id=request_id: answer(request_id, f))
+        await writer.drain()
+    if pending:
+        await asyncio.wait(list(pending))
+    await writer.drain()
+
+
+class _StdoutWriter(object):
+    """Stream writer interface over stdout"""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        sys.stdout.buffer.flush()
+
+
+async def serve(service, socket=None, port=None):
+    """Run the service on stdin and stdout, a Unix socket or a local TCP port"""
+    await service.start()
+    try:
+        if socket is None and port is None:
+            loop = asyncio.get_running_loop()
+            # stdin is read in a thread, since it may be a file or a terminal rather than a pipe
+            await serve_lines(service, lambda: loop.run_in_executor(None, sys.stdin.buffer.readline), _StdoutWriter())
+            return
+
+        async def connection(reader, writer):
+            try:
+                await serve_lines(service, reader.readline, writer)
+            finally:
+                writer.close()
+
+        if socket is not None:
+            server = await asyncio.start_unix_server(connection, socket)
+        else:
+            server = await asyncio.start_server(connection, '127.0.0.1', port)
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Sudoku solving over JSON lines.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--socket', help='listen on this Unix socket instead of stdin')
+    group.add_argument('--port', type=int, help='listen on this local TCP port instead of stdin')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('-q', '--queue-size', type=int, default=1024, help='puzzles queued before reading stops')
+    parser.add_argument('-b', '--batch-size', type=int, default=16, help='puzzles sent to a worker at a time')
+    parser.add_argument('-d', '--batch-delay', type=float, default=0.002,
+                        help='seconds to wait for a batch to fill (default: 0.002)')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default='backtracking', help='default solver engine')
+    parser.add_argument('-t', '--timeout', type=float, default=None, help='default time limit per puzzle in seconds')
+    args = parser.parse_args()
+
+    service = SolveService(args.processes, args.queue_size, args.batch_size, args.batch_delay, args.engine,
+                           args.timeout)
+    try:
+        asyncio.run(serve(service, args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    sys.stderr.write(json.dumps(service.stats()) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# stats.py
+
+"""
+Custom solver instrumentation. A SolverStats object can be passed to any search function as stats; it counts search
+nodes, backtracks, prunes, revise calls, AC-3 queue pushes and pops and the maximum depth, and times the init_domains,
+find_pairs and AC3 phases. When no stats object is given the solvers skip all of it, so collection costs close to
+nothing when disabled. An optional callback(stats, var, depth) is called at every node, e.g. to sample long searches.
+"""
+
+import time
+from functools import wraps
+
+
+class SolverStats(object):
+    __slots__ = ('nodes', 'backtracks', 'prunes', 'revise_calls', 'queue_pushes', 'queue_pops', 'max_depth',
+                 'phase_times', 'callback')
+
+    def __init__(self, callback=None):
+        self.nodes = 0
+        self.backtracks = 0
+        self.prunes = 0
+        self.revise_calls = 0
+        self.queue_pushes = 0
+        self.queue_pops = 0
+        self.max_depth = 0
+        self.phase_times = {}
+        self.callback = callback
+
+    def node(self, var, depth):
+        """Record a search node choosing var at depth"""
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.callback is not None:
+            self.callback(self, var, depth)
+
+    def add_time(self, phase, seconds):
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + seconds
+
+    def traced(self, queue):
+        """Wrap an AC-3 queue so its pushes, pops and the revise call made per pop are counted"""
+        self.queue_pushes += len(queue)
+        return _TracedQueue(self, queue)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'callback'}
+
+    def __repr__(self):
+        return 'SolverStats({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.as_dict().items()))
+
+
+class _TracedQueue(list):
+    __slots__ = ('stats',)
+
+    def __init__(self, stats, queue):
+        super().__init__(queue)
+        self.stats = stats
+
+    def append(self, arc):
+        self.stats.queue_pushes += 1
+        super().append(arc)
+
+    def pop(self, *args):
+        self.stats.queue_pops += 1
+        self.stats.revise_calls += 1
+        return super().pop(*args)
+
+
+def timed_phase(phase):
+    """Decorate a function taking a CSP as its first argument so its run time is added to csp.stats under phase"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(csp, *args, **kwargs):
+            stats = csp.stats
+            if stats is None:
+                return fn(csp, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(csp, *args, **kwargs)
+            finally:
+                stats.add_time(phase, time.perf_counter() - start)
+        return wrapper
+    return decorate
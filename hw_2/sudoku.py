@@ -2,21 +2,57 @@
 
 from sudoku_io import SudokuIO
 from utils import CSP
+from sudoku_csp import SudokuCSP
+from dlx import dlx_search
+from iterative import iterative_search
+from backjumping import backjumping_search
 from backtracking import (recursive_backtracking_search, instrumented_recursive_backtracking, backtracking_search,
                           first_unassigned_variable, mrv, no_inference, mac, equal_constraint)
 
+ENGINES = ('backtracking', 'iterative', 'backjumping', 'dlx')
 
-def solve(variables, domains, neighbors, assignment, heuristic, with_inferences, instrumented):
-    sudoku = CSP(variables, domains, neighbors, equal_constraint)
+
+def check_engine(engine):
+    """Raise ValueError unless engine is one of ENGINES"""
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine {!r}, expected one of {}'.format(engine, ', '.join(ENGINES)))
+
+
+def solve(variables, domains, neighbors, assignment, heuristic, with_inferences, instrumented, backend=CSP,
+          engine='backtracking', limits=None):
+    check_engine(engine)
+    sudoku = backend(variables, domains, neighbors, equal_constraint)
+    if engine == 'dlx':
+        return dlx_search(assignment, sudoku, limits=limits)
+    if engine == 'iterative':
+        return iterative_search(assignment, sudoku, heuristic, mac if with_inferences else no_inference, False,
+                                limits=limits)
+    if engine == 'backjumping':
+        # needs backend=SudokuCSP, and always runs MAC
+        return backjumping_search(assignment, sudoku, heuristic, False, limits=limits)
     if with_inferences:
         # problem 2.4
-        return backtracking_search(assignment, sudoku, heuristic, mac)
+        return backtracking_search(assignment, sudoku, heuristic, mac, False, limits=limits)
     elif instrumented:
         # problem 2.3
-        return instrumented_recursive_backtracking(assignment, sudoku, heuristic)
+        return instrumented_recursive_backtracking(assignment, sudoku, heuristic, limits=limits)
     else:
         # problem 2.2
-        return recursive_backtracking_search(assignment, sudoku, heuristic)
+        return recursive_backtracking_search(assignment, sudoku, heuristic, limits=limits)
+
+
+def solve_board(board, heuristic=mrv, all_methods=True, engine='backtracking', verbose=False, limits=None):
+    """Custom solve of a board.Board straight from its cells, without building the dicts of SudokuIO. The givens are
+    read from the board itself."""
+    check_engine(engine)
+    sudoku = SudokuCSP.from_board(board, equal_constraint)
+    if engine == 'dlx':
+        return dlx_search(board, sudoku, verbose, limits=limits)
+    if engine == 'iterative':
+        return iterative_search(board, sudoku, heuristic, mac, all_methods, verbose, limits=limits)
+    if engine == 'backjumping':
+        return backjumping_search(board, sudoku, heuristic, all_methods, verbose, limits=limits)
+    return backtracking_search(board, sudoku, heuristic, mac, all_methods, verbose, limits=limits)
 
 
 def solve_problem_2_2(puzzles):
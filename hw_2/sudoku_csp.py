@@ -0,0 +1,367 @@
+# sudoku_csp.py
+
+"""
+Custom Sudoku-specialised CSP backend. Each variable's domain is stored as an integer mask in a flat list indexed by
+variable, where bit v - 1 is set while value v is still legal. Pruning is a single AND-NOT, domain sizes come from a
+popcount table and drive an incremental MRV bucket queue, and revise reduces to a singleton check since every Sudoku
+constraint is inequality.
+
+SudokuCSP can be passed anywhere a utils.CSP is expected; the helpers in backtracking.py dispatch to the mask-based
+methods below. The grid size follows from the number of variables (81, 256, 625, ...), and the popcount and value
+tables of each size are shared between instances: full tuples up to 9 values, lazily filled dicts above, where a full
+table would have 2 ** 16 or 2 ** 25 entries.
+"""
+
+from utils import CSP, argmin_random_tie
+from sudoku_index import get_index, box_for
+
+NUM_VALUES = 9
+FULL_MASK = (1 << NUM_VALUES) - 1
+
+POPCOUNT = tuple(bin(m).count('1') for m in range(FULL_MASK + 1))
+MASK_VALUES = tuple(tuple(v + 1 for v in range(NUM_VALUES) if m >> v & 1) for m in range(FULL_MASK + 1))
+
+
+class _LazyTable(dict):
+    """Table of a function of a mask, filled on first lookup of each mask"""
+
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    def __missing__(self, mask):
+        value = self[mask] = self.fn(mask)
+        return value
+
+
+_TABLES = {NUM_VALUES: (POPCOUNT, MASK_VALUES)}
+
+
+def mask_tables(size):
+    """Return the popcount and mask values tables of masks over size values"""
+    if size not in _TABLES:
+        if size <= NUM_VALUES:
+            _TABLES[size] = (POPCOUNT[:1 << size], MASK_VALUES[:1 << size])
+        else:
+            _TABLES[size] = (_LazyTable(lambda m: bin(m).count('1')),
+                             _LazyTable(lambda m: tuple(v + 1 for v in range(size) if m >> v & 1)))
+    return _TABLES[size]
+
+
+def value_mask(value):
+    """Return the mask with only the bit for value set"""
+    return 1 << (value - 1)
+
+
+def to_mask(values):
+    """Return the mask of a list of values"""
+    m = 0
+    for v in values:
+        m |= 1 << (v - 1)
+    return m
+
+
+class _MaskDomains(object):
+    """Read-only domains view over a list of masks"""
+    __slots__ = ('masks', 'mask_values')
+
+    def __init__(self, masks, mask_values):
+        self.masks = masks
+        self.mask_values = mask_values
+
+    def __getitem__(self, var):
+        return list(self.mask_values[self.masks[var]])
+
+
+class SudokuCSP(CSP):
+    """Domains live in curr_domains as masks. Every prune is recorded on a single undo trail, so suppose returns a
+    checkpoint (the trail length) that restore unwinds to. Unassigned variables are kept in buckets keyed by domain
+    size, updated on every prune and restore, so mrv takes the first non-empty bucket instead of scanning all variables.
+    The buckets belong to the assignment of one search and are rebuilt when mrv is called with another, so the CSP can
+    be searched again. Ties go to the lowest variable unless a random.Random is passed as rng. from_board builds the
+    CSP of a board.Board directly from its cells, with the grid index for variables and neighbors and domains read from
+    the masks."""
+
+    def __init__(self, variables, domains, neighbors, constraints=None, rng=None, masks=None):
+        super().__init__(variables, domains, neighbors, constraints)
+        self.masks = masks if masks is not None else [to_mask(domains[v]) for v in self.variables]
+        self.index = get_index(box_for(len(self.variables)))
+        self.size = self.index.size
+        self.full_mask = (1 << self.size) - 1
+        self.popcount, self.mask_values = mask_tables(self.size)
+        if domains is None:
+            self.domains = _MaskDomains(self.masks, self.mask_values)
+        self.peers = self.index.peers
+        self.rng = rng
+        self.trail = []
+        self.buckets = None
+        self.queued = None
+        # the assignment the buckets were built for
+        self.bucketed = None
+        self.supports = None
+        self.weights = None
+        # explanations for backjumping: the decision levels behind the removal of each value, as a bit mask
+        self.explain = None
+        self.reason = 0
+        self.failure = 0
+
+    @classmethod
+    def from_board(cls, board, constraints=None, rng=None):
+        index = board.index
+        full = (1 << index.size) - 1
+        masks = [1 << (v - 1) if v else full for v in board.cells()]
+        return cls(range(index.num_cells), None, index.peers, constraints, rng, masks)
+
+    def nconflicts(self, var, val, assignment):
+        return sum(1 for n in self.peers[var] if assignment.get(n) == val)
+
+    def assign(self, var, val, assignment):
+        super().assign(var, val, assignment)
+        if self.buckets is not None and self.queued[var]:
+            self.queued[var] = False
+            self.buckets[self.popcount[self.curr_domains[var]]].discard(var)
+
+    def unassign(self, var, assignment):
+        super().unassign(var, assignment)
+        if self.buckets is not None and not self.queued[var]:
+            self.queued[var] = True
+            self.buckets[self.popcount[self.curr_domains[var]]].add(var)
+
+    def support_pruning(self):
+        if self.curr_domains is None:
+            self.curr_domains = list(self.masks)
+
+    def checkpoint(self):
+        """Return a mark that restore can unwind the trail to"""
+        return len(self.trail)
+
+    def suppose(self, var, value):
+        self.support_pruning()
+        mark = len(self.trail)
+        removed = self.curr_domains[var] & ~value_mask(value)
+        if removed:
+            self._remove(var, removed)
+        return mark
+
+    def prune(self, var, value, removals):
+        self.prune_mask(var, value_mask(value), removals)
+
+    def prune_mask(self, var, mask, removals):
+        """Remove every value in mask from the domain of var. The removal always goes on the trail, so removals is
+        accepted only for compatibility with the generic CSP interface."""
+        self.nprunes += self.popcount[self.curr_domains[var] & mask]
+        self._remove(var, mask)
+
+    def _remove(self, var, mask):
+        old = self.curr_domains[var]
+        self.curr_domains[var] = old & ~mask
+        self.trail.append((var, old & mask))
+        if self.buckets is not None and self.queued[var]:
+            self.buckets[self.popcount[old]].discard(var)
+            self.buckets[self.popcount[old & ~mask]].add(var)
+        if self.supports is not None:
+            self._add_support(var, old & mask, -1)
+        if self.explain is not None:
+            base = var * (self.size + 1)
+            for x in self.mask_values[old & mask]:
+                self.explain[base + x] = self.reason
+
+    def choices(self, var):
+        return self.mask_values[(self.curr_domains or self.masks)[var]]
+
+    def infer_assignment(self):
+        self.support_pruning()
+        return {v: self.mask_values[m][0] for v, m in enumerate(self.curr_domains) if self.popcount[m] == 1}
+
+    def restore(self, removals):
+        """Undo every prune made since the checkpoint removals"""
+        domains = self.curr_domains
+        trail = self.trail
+        buckets = self.buckets
+        popcount = self.popcount
+        while len(trail) > removals:
+            B, b = trail.pop()
+            old = domains[B]
+            domains[B] = old | b
+            if buckets is not None and self.queued[B]:
+                buckets[popcount[old]].discard(B)
+                buckets[popcount[old | b]].add(B)
+            if self.supports is not None:
+                self._add_support(B, b, 1)
+
+    def num_legal_values(self, var, assignment):
+        if self.curr_domains:
+            return self.popcount[self.curr_domains[var]]
+        used = 0
+        for n in self.peers[var]:
+            if n in assignment:
+                used |= value_mask(assignment[n])
+        return self.popcount[self.masks[var] & ~used]
+
+    def _build_buckets(self, assignment):
+        self.bucketed = assignment
+        self.queued = [v not in assignment for v in self.variables]
+        self.buckets = [set() for _ in range(self.size + 1)]
+        for v in self.variables:
+            if self.queued[v]:
+                self.buckets[self.popcount[self.curr_domains[v]]].add(v)
+
+    def mrv(self, assignment):
+        if self.curr_domains is None:
+            unassigned = [v for v in self.variables if v not in assignment]
+            if self.rng is None:
+                return argmin_random_tie(unassigned, key=lambda var: self.num_legal_values(var, assignment))
+            sizes = [self.num_legal_values(v, assignment) for v in unassigned]
+            least = min(sizes, default=None)
+            return self.rng.choice([v for v, n in zip(unassigned, sizes) if n == least]) if unassigned else None
+        if self.buckets is None or self.bucketed is not assignment:
+            self._build_buckets(assignment)
+        for bucket in self.buckets:
+            while bucket:
+                var = self.rng.choice(tuple(bucket)) if self.rng else min(bucket)
+                if var not in assignment:
+                    return var
+                # assigned outside assign(), e.g. the givens passed to recursive_backtracking_search
+                bucket.discard(var)
+                self.queued[var] = False
+        return None
+
+    def _add_support(self, var, mask, n):
+        """Add n to the support of every value in mask in each unit of var"""
+        supports = self.supports
+        stride = self.size + 1
+        for u in self.index.unit_ids_of[var]:
+            base = u * stride
+            for x in self.mask_values[mask]:
+                supports[base + x] += n
+
+    def lcv(self, var):
+        """Values of var, least constraining first: ordered by how many cells of its units still allow each value,
+        from support counts per unit and value that are kept up to date on every prune and restore once built. A cell
+        sharing two units with var is counted twice."""
+        if self.supports is None:
+            self.supports = [0] * (len(self.index.units) * (self.size + 1))
+            for v in self.variables:
+                self._add_support(v, self.curr_domains[v], 1)
+        supports = self.supports
+        stride = self.size + 1
+        r, c, b = (u * stride for u in self.index.unit_ids_of[var])
+        return sorted(self.mask_values[self.curr_domains[var]],
+                      key=lambda x: supports[r + x] + supports[c + x] + supports[b + x])
+
+    def dom_wdeg(self, assignment):
+        """The unassigned variable with the least domain size over weighted degree, where each unit is weighted as
+        one constraint by 1 plus the failures AC3 found in it. Ties go as in mrv."""
+        if self.weights is None:
+            self.weights = [1] * len(self.index.units)
+        weights = self.weights
+        unit_ids_of = self.index.unit_ids_of
+        popcount, domains = self.popcount, self.curr_domains
+        best, best_score = [], None
+        for v in self.variables:
+            if v not in assignment:
+                r, c, b = unit_ids_of[v]
+                size = popcount[domains[v]] if domains is not None else self.num_legal_values(v, assignment)
+                score = size / (weights[r] + weights[c] + weights[b])
+                if best_score is None or score < best_score:
+                    best, best_score = [v], score
+                elif score == best_score:
+                    best.append(v)
+        if not best:
+            return None
+        return self.rng.choice(best) if self.rng else best[0]
+
+    def start_explaining(self):
+        """Record from now on the reason set in reason for every value removed, with no reason for the values removed
+        so far"""
+        self.support_pruning()
+        self.explain = [0] * (len(self.variables) * (self.size + 1))
+        self.reason = 0
+        self.failure = 0
+
+    def why(self, var):
+        """The decision levels behind the values removed from the domain of var so far"""
+        base = var * (self.size + 1)
+        reason = 0
+        for x in self.mask_values[self.full_mask & ~self.curr_domains[var]]:
+            reason |= self.explain[base + x]
+        return reason
+
+    def _bump(self, Xi, Xj):
+        """Count a failure of the constraint between Xi and Xj in the units they share"""
+        shared = self.index.unit_ids_of[Xj]
+        for u in self.index.unit_ids_of[Xi]:
+            if u in shared:
+                self.weights[u] += 1
+
+    def revise(self, Xi, Xj, removals):
+        """A value of Xi has no support in Xj only when Xj is reduced to that single value"""
+        dj = self.curr_domains[Xj]
+        if dj == 0:
+            dj = self.curr_domains[Xi]
+        elif self.popcount[dj] != 1:
+            return False
+        if self.curr_domains[Xi] & dj:
+            if self.explain is not None:
+                self.reason = self.why(Xj)
+            self.prune_mask(Xi, self.curr_domains[Xi] & dj, removals)
+            return True
+        return False
+
+    def AC3(self, queue, removals):
+        domains = self.curr_domains
+        peers = self.peers
+        revise = self.revise
+        while queue:
+            (Xi, Xj) = queue.pop()
+            if revise(Xi, Xj, removals):
+                if not domains[Xi]:
+                    if self.weights is not None:
+                        self._bump(Xi, Xj)
+                    if self.explain is not None:
+                        self.failure = self.why(Xi)
+                    return False
+                for Xk in peers[Xi]:
+                    if Xk != Xj:
+                        queue.append((Xk, Xi))
+        return True
+
+    def find_pairs(self, removals):
+        """Hidden pairs inference on masks, see backtracking.find_pairs"""
+        domains = self.curr_domains
+        index = self.index
+        row_of, col_of, box_of = index.row_of, index.col_of, index.box_of
+        for v1 in self.variables:
+            d1 = domains[v1]
+            if self.popcount[d1] != 2:
+                continue
+            for v2 in self.peers[v1]:
+                if domains[v2] == d1:
+                    others = ()
+                    if row_of[v1] == row_of[v2]:
+                        others = index.rows[row_of[v1]]
+                    elif col_of[v1] == col_of[v2]:
+                        others = index.cols[col_of[v1]]
+                    if box_of[v1] == box_of[v2]:
+                        others += index.boxes[box_of[v1]]
+                    for v3 in set(others):
+                        if v3 != v1 and v3 != v2 and domains[v3] & d1:
+                            if self.explain is not None:
+                                self.reason = self.why(v1) | self.why(v2)
+                            self.prune_mask(v3, domains[v3] & d1, removals)
+
+    def init_domains(self, assignment):
+        """Domain initialization preprocessing step on masks, see backtracking.init_domains"""
+        bits = [0] * len(self.variables)
+        for n, value in assignment.items():
+            bits[n] = value_mask(value)
+        d = []
+        for i in self.variables:
+            used = 0
+            for n in self.peers[i]:
+                used |= bits[n]
+            d.append(self.full_mask & ~used if self.masks[i] else 0)
+        self.curr_domains = d
+        self.trail = []
+        self.buckets = None
+        self.supports = None
@@ -0,0 +1,50 @@
+# sudoku_index.py
+
+"""
+Custom precomputed index of the Sudoku grid. The units (rows, columns and boxes), the peers of each cell and the units
+each cell belongs to, both as cell tuples and as positions in units, are built once at import as tuples, and shared by
+SudokuIO, the search helpers and SudokuCSP instead of being rescanned for every puzzle. INDEX is the 9x9 grid; indexes
+of other box sizes (16x16, 25x25, ...) are built on first use by get_index and cached.
+"""
+
+from collections import namedtuple
+
+SudokuIndex = namedtuple('SudokuIndex', ['box', 'size', 'num_cells', 'rows', 'cols', 'boxes', 'units',
+                                         'row_of', 'col_of', 'box_of', 'units_of', 'unit_ids_of', 'peers'])
+
+
+def build_index(box=3):
+    """Build the index of a grid made of box x box boxes"""
+    size = box * box
+    num_cells = size * size
+    cells = range(num_cells)
+    row_of = tuple(i // size for i in cells)
+    col_of = tuple(i % size for i in cells)
+    box_of = tuple((row_of[i] // box) * box + col_of[i] // box for i in cells)
+    rows = tuple(tuple(i for i in cells if row_of[i] == r) for r in range(size))
+    cols = tuple(tuple(i for i in cells if col_of[i] == c) for c in range(size))
+    boxes = tuple(tuple(i for i in cells if box_of[i] == b) for b in range(size))
+    units_of = tuple((rows[row_of[i]], cols[col_of[i]], boxes[box_of[i]]) for i in cells)
+    unit_ids_of = tuple((row_of[i], size + col_of[i], 2 * size + box_of[i]) for i in cells)
+    peers = tuple(tuple(sorted(set(rows[row_of[i]] + cols[col_of[i]] + boxes[box_of[i]]) - {i})) for i in cells)
+    return SudokuIndex(box, size, num_cells, rows, cols, boxes, rows + cols + boxes,
+                       row_of, col_of, box_of, units_of, unit_ids_of, peers)
+
+
+INDEX = build_index(3)
+_INDEXES = {3: INDEX}
+
+
+def get_index(box=3):
+    """Return the shared index of a grid made of box x box boxes"""
+    if box not in _INDEXES:
+        _INDEXES[box] = build_index(box)
+    return _INDEXES[box]
+
+
+def box_for(num_cells):
+    """Return the box size of a grid with num_cells cells"""
+    box = int(round(num_cells ** 0.25))
+    if box ** 4 != num_cells:
+        raise ValueError('{} cells do not make a square grid of square boxes'.format(num_cells))
+    return box
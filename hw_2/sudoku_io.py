@@ -1,58 +1,153 @@
 # sudoku_io.py
 
-from utils import same_row, same_col, same_box
+import gzip
+import mmap
+from contextlib import contextmanager
+
+from sudoku_index import get_index, box_for
+
+BLANK_TABLE = bytes.maketrans(b'-.', b'00')
+WHITESPACE = b' \t\r\n'
+GZIP_MAGIC = b'\x1f\x8b'
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _cell_values(line, size=9):
+    """Custom method to map a line of a puzzle file, as bytes, to its cell values. Grids with more than 9 values are
+    written either as spaced numbers or as one character per cell with letters from A = 10 on, and a token is read as
+    one value only when it is no longer than the largest value."""
+    if size <= 9:
+        cells = [c - 48 for c in line.translate(BLANK_TABLE, WHITESPACE)]
+    else:
+        cells = []
+        try:
+            for token in line.decode().upper().split():
+                if len(token) <= len(str(size)) and token.isdigit():
+                    cells.append(int(token))
+                else:
+                    cells += [0 if c in '-.' else DIGITS.index(c) for c in token]
+        except ValueError:
+            raise ValueError('Invalid puzzle line: {!r}'.format(line))
+    if cells and (min(cells) < 0 or max(cells) > size):
+        raise ValueError('Invalid puzzle line: {!r}'.format(line))
+    return cells
+
+
+def parse_grids(text, box=3):
+    """Custom method to split text into puzzles of 81 cell values (size ** 2 for other box sizes), accepting both the
+    spaced grid format and 81-character lines, with '-', '.' or '0' for an empty cell"""
+    n = get_index(box).num_cells
+    cells = _cell_values(text.encode(), box * box)
+    return [cells[i:i + n] for i in range(0, len(cells) - n + 1, n)]
+
+
+@contextmanager
+def _open_lines(path):
+    """Custom method to iterate over the lines of a gzip file, or of a plain file through a memory map so files larger
+    than RAM are paged in on demand"""
+    with open(path, 'rb') as file:
+        if file.read(2) == GZIP_MAGIC:
+            file.seek(0)
+            with gzip.open(file) as lines:
+                yield lines
+        elif file.seek(0, 2) == 0:
+            yield iter(())
+        else:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield iter(mm.readline, b'')
+
+
+def iter_puzzles(path, box=3):
+    """Custom generator over the puzzles of a multi-puzzle file in the spaced grid or 81-character line format,
+    optionally gzip-compressed, yielding the 81 cell values of each (size ** 2 for other box sizes)"""
+    n = get_index(box).num_cells
+    with _open_lines(path) as lines:
+        cells = []
+        for line in lines:
+            cells += _cell_values(line, box * box)
+            while len(cells) >= n:
+                yield cells[:n]
+                cells = cells[n:]
+
+
+def format_grid(values):
+    """Custom method to format cell values in the spaced grid format of the puzzle files"""
+    size = box_for(len(values)) ** 2
+    return ''.join(' '.join(str(v) if v else '-' for v in values[r:r + size]) + ' \r\n'
+                   for r in range(0, len(values), size))
+
+
+def format_line(values):
+    """Custom method to format cell values as one line of one character per cell, with letters from A = 10 on and '.'
+    for empty cells"""
+    return ''.join(DIGITS[v] if v else '.' for v in values) + '\n'
+
+
+class PuzzleWriter(object):
+    """Custom buffered writer that appends puzzles to a file, gzip-compressed if the name ends in .gz, in the line
+    format or the grid format. Puzzles are written out buffer_size at a time."""
+
+    def __init__(self, path, grid=False, buffer_size=1024):
+        self.file = gzip.open(path, 'at') if path.endswith('.gz') else open(path, 'a')
+        self.format = format_grid if grid else format_line
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def write(self, values):
+        self.buffer.append(self.format(values))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.buffer))
+        self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 class SudokuIO(object):
 
-    def __init__(self, input='001', output='puzzles/output.txt'):
+    def __init__(self, input='001', output='puzzles/output.txt', values=None, box=None):
         self.input = 'puzzles/puzzle_{}.txt'.format(input)
         self.output = output
-        self.NUM_VARS = 81
+        if box is None:
+            box = 3 if values is None else box_for(len(values))
+        self.index = get_index(box)
+        self.size = self.index.size
+        self.NUM_VARS = self.index.num_cells
         self.vars = [0] * self.NUM_VARS
-        self.var_domain = [[None] * 9 for _ in range(self.NUM_VARS)]
-        self.variables = [i for i in range(81)]
-        self._build_puzzle()
+        self.variables = [i for i in range(self.NUM_VARS)]
+        if values is None:
+            self._build_puzzle()
+        else:
+            self.vars = list(values)
         self.domains = self._domains()
-        self.neighbors = {i: [j for j in range(81) if i != j and (same_row(i, j) or same_col(i, j) or same_box(i, j))]
-                          for i in self.variables}
+        self.neighbors = {i: self.index.peers[i] for i in self.variables}
         self.assignment = {i: self.vars[i] for i in self.variables if self.vars[i] != 0}
 
     def _domains(self):
         d = {}
         for i in self.variables:
             if self.vars[i] == 0:
-                l = [j for j in range(1, 10)]
+                l = [j for j in range(1, self.size + 1)]
             else:
                 l = [self.vars[i]]
             d[i] = l
         return d
 
     def _build_puzzle(self):
-        file = open(self.input, 'r')
-        for a in range(self.NUM_VARS):
-            ch = ' '
-            while ch == '\n' or ch == '\r' or ch == ' ':
-                ch = file.readline(1)
-            if ch == '-':
-                self.vars[a] = 0
-            else:
-                s = '' + ch
-                i = int(s)
-                self.vars[a] = i
-                for j in range(9):
-                    if j == i - 1:
-                        self.var_domain[a][j] = True
-                    else:
-                        self.var_domain[a][j] = False
+        with open(self.input, 'rb') as file:
+            self.vars = _cell_values(file.read(), self.size)[:self.NUM_VARS]
 
     def output_puzzle(self, solution):
-        file = open(self.output, 'w')
-        for a in range(9):
-            for b in range(9):
-                c = 9 * a + b
-                if solution[c] == 0:
-                    file.write('- ')
-                else:
-                    file.write(str(solution[c]) + ' ')
-            file.write('\r\n')
+        with open(self.output, 'w', newline='') as file:
+            file.write(format_grid([solution[c] for c in range(self.NUM_VARS)]))
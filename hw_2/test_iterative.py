@@ -0,0 +1,70 @@
+# test_iterative.py
+
+"""
+Custom tests of IterativeSearch checkpoints: a search paused after a few nodes, saved and resumed on a new CSP must end
+as the uninterrupted search does, on SudokuCSP and on utils.CSP.
+"""
+
+import zlib
+
+import pytest
+
+from sudoku_io import SudokuIO, parse_grids
+from sudoku_csp import SudokuCSP
+from utils import CSP
+from backtracking import mrv, mac, equal_constraint
+from iterative import IterativeSearch
+
+PUZZLE = parse_grids('.19........8..3.5..7.6...8...1..68.98...4...794.....1......2.......8.561..37...9.')[0]
+
+BACKENDS = {
+    'sudoku_csp': lambda p: SudokuCSP(p.variables, p.domains, p.neighbors),
+    'csp': lambda p: CSP(p.variables, p.domains, p.neighbors, equal_constraint),
+}
+
+
+def new_search(backend, all_methods):
+    puzzle = SudokuIO(values=PUZZLE)
+    csp = BACKENDS[backend](puzzle)
+    return IterativeSearch(puzzle.assignment, csp, mrv, mac, all_methods, verbose=False), puzzle
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('all_methods', [False, True])
+@pytest.mark.parametrize('nodes', [1, 3, 10])
+def test_checkpoint_round_trip(backend, all_methods, nodes):
+    search, _ = new_search(backend, all_methods)
+    assert search.step() == 'solved'
+    expected = search.result
+
+    search, _ = new_search(backend, all_methods)
+    assert search.step(nodes) == 'running'
+    data = search.checkpoint()
+    decisions = search.decisions()
+
+    puzzle = SudokuIO(values=PUZZLE)
+    resumed = IterativeSearch.from_checkpoint(data, BACKENDS[backend](puzzle), mrv, mac, verbose=False)
+    assert resumed.decisions() == decisions
+    assert resumed.guesses == search.guesses
+    assert resumed.step() == search.step() == 'solved'
+    assert resumed.result == search.result == expected
+    if backend == 'sudoku_csp':
+        # a utils.CSP rebuilt by replay may hold its domains in another order, so only a SudokuCSP takes the same path
+        assert resumed.guesses == search.guesses
+
+
+def test_checkpoint_of_finished_search():
+    search, _ = new_search('sudoku_csp', True)
+    search.step()
+    resumed = IterativeSearch.from_checkpoint(search.checkpoint(), verbose=False)
+    assert resumed.status == 'solved'
+    assert resumed.result == search.result
+
+
+def test_checkpoint_version_mismatch():
+    search, _ = new_search('sudoku_csp', False)
+    search.step(1)
+    data = bytearray(zlib.decompress(search.checkpoint()))
+    data[0] = 1
+    with pytest.raises(ValueError):
+        IterativeSearch.from_checkpoint(zlib.compress(bytes(data)), verbose=False)
@@ -0,0 +1,32 @@
+# test_portfolio.py
+
+"""
+Custom tests of the portfolio strategies: a seeded strategy must search the same tree on every run, and differently
+seeded ones different trees.
+"""
+
+import queue
+import threading
+
+from sudoku_io import parse_grids
+from portfolio import Strategy, _race_worker
+
+PUZZLE = parse_grids('.19........8..3.5..7.6...8...1..68.98...4...794.....1......2.......8.561..37...9.')[0]
+
+
+def run(strategy):
+    """Run one race worker in this process and return its status and search nodes"""
+    results = queue.Queue()
+    _race_worker(PUZZLE, strategy, threading.Event(), results)
+    _, status, _, nodes = results.get()
+    return status, nodes
+
+
+def test_seeded_strategies_are_repeatable_and_differ():
+    nodes = {}
+    for seed in (2, 4):
+        first = run(Strategy('backtracking', False, seed))
+        assert first[0] == 'solved'
+        assert run(Strategy('backtracking', False, seed)) == first
+        nodes[seed] = first[1]
+    assert nodes[2] != nodes[4]
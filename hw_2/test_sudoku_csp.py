@@ -0,0 +1,44 @@
+# test_sudoku_csp.py
+
+"""
+Custom tests of SudokuCSP searches: a CSP searched more than once and the tie-breaking of a seeded rng.
+"""
+
+import random
+
+from sudoku_io import SudokuIO, parse_grids
+from sudoku_csp import SudokuCSP
+from backtracking import (backtracking_search, instrumented_recursive_backtracking, has_unique_solution,
+                          count_solutions, mrv, mac)
+
+PUZZLE = parse_grids('.19........8..3.5..7.6...8...1..68.98...4...794.....1......2.......8.561..37...9.')[0]
+
+
+def new_csp(rng=None):
+    puzzle = SudokuIO(values=PUZZLE)
+    return SudokuCSP(puzzle.variables, puzzle.domains, puzzle.neighbors, rng=rng), puzzle
+
+
+def test_search_twice():
+    csp, puzzle = new_csp()
+    first = backtracking_search(puzzle.assignment, csp, mrv, mac, False, verbose=False)
+    second = backtracking_search(puzzle.assignment, csp, mrv, mac, False, verbose=False)
+    assert first is not None
+    assert second == first
+
+
+def test_count_solutions_twice():
+    csp, _ = new_csp()
+    assert has_unique_solution(csp)
+    assert has_unique_solution(csp)
+    assert count_solutions(csp) == 1
+
+
+def test_rng_makes_search_reproducible():
+    guesses = []
+    for seed in range(3):
+        random.seed(seed)
+        csp, puzzle = new_csp(random.Random(1))
+        instrumented_recursive_backtracking(dict(puzzle.assignment), csp, mrv, verbose=False)
+        guesses.append(csp.nguesses)
+    assert len(set(guesses)) == 1
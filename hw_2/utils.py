@@ -5,9 +5,10 @@ All methods in utils.py are based on implementations from Russell And Norvig's "
 Approach" at https://github.com/aimacode/aima-python unless otherwise noted.
 """
 
-import math
 import random
 
+from sudoku_index import get_index
+
 
 class Problem(object):
 
@@ -45,6 +46,10 @@ class CSP(Problem):
         self.initial = ()
         self.curr_domains = None
         self.nassigns = 0
+        self.nguesses = 0
+        self.nprunes = 0
+        self.stats = None
+        self.weights = None
 
     def assign(self, var, val, assignment):
         assignment[var] = val
@@ -92,6 +97,7 @@ class CSP(Problem):
 
     def prune(self, var, value, removals):
         self.curr_domains[var].remove(value)
+        self.nprunes += 1
         if removals is not None:
             removals.append((var, value))
 
@@ -127,52 +133,50 @@ def is_in(elt, seq):
     return any(x is elt for x in seq)
 
 
-def get_x(i):
+def get_x(i, box=3):
     """Custom method to map variable index to row in Sudoku grid"""
-    return math.floor(i / 9)
+    return get_index(box).row_of[i]
 
 
-def get_y(i):
+def get_y(i, box=3):
     """Custom method to map variable index to column in Sudoku grid"""
-    return i % 9
+    return get_index(box).col_of[i]
 
 
-def same_row(i, j):
+def same_row(i, j, box=3):
     """Custom method to check if two variables are in the same row"""
-    if get_x(i) == get_x(j):
-        return True
-    return False
+    index = get_index(box)
+    return index.row_of[i] == index.row_of[j]
 
 
-def same_col(i, j):
+def same_col(i, j, box=3):
     """Custom method to check if two variables are in the same column"""
-    if get_y(i) == get_y(j):
-        return True
-    return False
+    index = get_index(box)
+    return index.col_of[i] == index.col_of[j]
 
 
-def same_box(i, j):
+def same_box(i, j, box=3):
     """Custom method to check if two variables are in the same box"""
-    xi = get_x(i)
-    yi = get_y(i)
-    xj = get_x(j)
-    yj = get_y(j)
-    return (int(xi / 3), int(yi / 3)) == (int(xj / 3), int(yj / 3))
+    index = get_index(box)
+    return index.box_of[i] == index.box_of[j]
 
 
-def get_col(i):
+def get_col(i, box=3):
     """Custom method to return all variables in the same column as the input variable"""
-    return [j for j in range(0, 81) if same_col(i, j)]
+    index = get_index(box)
+    return list(index.cols[index.col_of[i]])
 
 
-def get_row(i):
+def get_row(i, box=3):
     """Custom method to return all variables in the same row as the input variable"""
-    return [j for j in range(0, 81) if same_row(i, j)]
+    index = get_index(box)
+    return list(index.rows[index.row_of[i]])
 
 
-def get_box(i):
+def get_box(i, box=3):
     """Custom method to return all variables in the same box as the input variable"""
-    return [j for j in range(0, 81) if same_box(i, j)]
+    index = get_index(box)
+    return list(index.boxes[index.box_of[i]])
 
 
 def num_legal_val(csp, var, assignment):
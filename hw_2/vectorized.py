@@ -0,0 +1,118 @@
+# vectorized.py
+
+"""
+Custom batched solver mode. N puzzles are held as an (N, 81, 9) boolean candidate tensor ((N, 256, 16) for 16x16
+grids) and the propagation done by init_domains and AC3 (peer elimination), plus naked and hidden singles, runs as
+vectorised passes over all of them at once. Only the puzzles that propagation alone leaves unsolved fall back to
+backtracking_search.
+"""
+
+import time
+
+import numpy as np
+
+from sudoku_index import get_index, box_for
+from sudoku_csp import SudokuCSP
+from backtracking import backtracking_search, mrv, mac
+from limits import SearchLimits
+
+_UNITS = {}
+
+
+def unit_arrays(box=3):
+    """Return the units and the unit ids of each cell of a grid made of box x box boxes as arrays"""
+    if box not in _UNITS:
+        index = get_index(box)
+        _UNITS[box] = (np.array(index.units), np.array(index.unit_ids_of))
+    return _UNITS[box]
+
+
+def to_candidates(grids, box=3):
+    """Map an (N, 81) array of cell values, 0 for empty, to an (N, 81, 9) candidate tensor"""
+    grids = np.asarray(grids, dtype=np.int8)
+    values = np.arange(1, box * box + 1, dtype=np.int8)
+    return (grids[..., None] == values) | (grids[..., None] == 0)
+
+
+def propagate(cand):
+    """Apply peer elimination, naked singles and hidden singles to every puzzle until none of them changes. Returns the
+    reduced candidates and a boolean array marking the puzzles found to be contradictory. Each pass only works on the
+    puzzles that changed in the previous one."""
+    units, units_of = unit_arrays(box_for(cand.shape[1]))
+    cand = cand.copy()
+    contradiction = np.zeros(len(cand), dtype=bool)
+    active = np.arange(len(cand))
+    while len(active):
+        sub = cand[active]
+        before = sub.copy()
+        solved = sub.sum(axis=2, dtype=np.int8) == 1
+        solved_vals = sub & solved[..., None]
+        unit_solved = solved_vals[:, units, :].sum(axis=2, dtype=np.int8)
+        # naked singles: drop the value of every solved peer from each unsolved cell
+        seen = (unit_solved[:, units_of, :] > 0).any(axis=2)
+        sub &= ~(seen & ~solved_vals)
+        # hidden singles: a value with exactly one place left in a unit goes there
+        unit_counts = sub[:, units, :].sum(axis=2, dtype=np.int8)
+        hidden = (unit_counts[:, units_of, :] == 1).any(axis=2) & sub
+        sub = np.where(hidden.any(axis=2)[..., None], hidden, sub)
+        contradiction[active] = (unit_solved > 1).any(axis=(1, 2)) | (unit_counts == 0).any(axis=(1, 2)) | \
+            (~sub.any(axis=2)).any(axis=1)
+        cand[active] = sub
+        active = active[(sub != before).any(axis=(1, 2))]
+    return cand, contradiction
+
+
+def solve_many(grids, chunksize=4096, box=3):
+    """Solve an (N, 81) array of cell values. Returns an (N, 81) array of solutions, with rows of zeros for puzzles
+    without a solution, and a boolean array marking the puzzles that needed backtracking_search."""
+    solutions, searched, _ = _solve_many(grids, chunksize, box, None)
+    return solutions, searched
+
+
+def solve_many_limited(grids, limits, chunksize=4096, box=3):
+    """solve_many with every backtracking_search bounded by its own copy of limits: the time left to their deadline
+    when called, their node limit and their token. Returns the arrays of solve_many and a third boolean array marking
+    the puzzles whose search the limits stopped, which are left as rows of zeros too."""
+    return _solve_many(grids, chunksize, box, limits)
+
+
+def _solve_many(grids, chunksize, box, limits):
+    grids = np.asarray(grids, dtype=np.int8).reshape(-1, get_index(box).num_cells)
+    solutions = np.zeros_like(grids)
+    searched = np.zeros(len(grids), dtype=bool)
+    stopped = np.zeros(len(grids), dtype=bool)
+    budget = None
+    if limits is not None and limits.deadline is not None:
+        budget = max(limits.deadline - time.monotonic(), 0)
+    for start in range(0, len(grids), chunksize):
+        cand, contradiction = propagate(to_candidates(grids[start:start + chunksize], box))
+        done = (cand.sum(axis=2) == 1).all(axis=1) & ~contradiction
+        solutions[start:start + chunksize][done] = cand[done].argmax(axis=2) + 1
+        for k in np.flatnonzero(~done & ~contradiction):
+            searched[start + k] = True
+            if limits is None:
+                solution = search_candidates(cand[k])
+            else:
+                result = search_candidates(cand[k], SearchLimits(timeout=budget, max_nodes=limits.max_nodes,
+                                                                 token=limits.token))
+                stopped[start + k] = result.status not in ('solved', 'unsatisfiable')
+                solution = [result.assignment[i] for i in range(len(cand[k]))] if result.status == 'solved' else None
+            if solution is not None:
+                solutions[start + k] = solution
+    return solutions, searched, stopped
+
+
+def search_candidates(cand, limits=None):
+    """Run backtracking_search on a SudokuCSP whose domains are the propagated candidates of one puzzle. Returns the
+    SearchResult of the search when limits are given."""
+    index = get_index(box_for(len(cand)))
+    variables = list(range(index.num_cells))
+    domains = {i: [int(v) + 1 for v in np.flatnonzero(cand[i])] for i in variables}
+    assignment = {i: d[0] for i, d in domains.items() if len(d) == 1}
+    sudoku = SudokuCSP(variables, domains, {i: index.peers[i] for i in variables})
+    result = backtracking_search(assignment, sudoku, mrv, mac, False, verbose=False, limits=limits)
+    if limits is not None:
+        return result
+    if result is None:
+        return None
+    return [result[i] for i in variables]